@@ -66,10 +66,15 @@ export function fetchCmsConfig(
 
     return fetch(url)
       .then((resp: Response) => {
-        return resp.text();
+        const contentType = resp.headers.get('Content-Type') || '';
+        return resp.text().then(text => ({
+          isJson: contentType.startsWith('application/json'),
+          text,
+        }));
       })
-      .then(text => {
-        const parsed = yaml.safeLoad(text);
+      .then(({ isJson, text }) => {
+        // cms-api/config.json serves the config in JSON
+        const parsed = isJson ? JSON.parse(text) : yaml.safeLoad(text);
         if (isObject(parsed)) {
           return parseCmsConfig(parsed);
         } else {
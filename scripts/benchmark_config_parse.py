@@ -0,0 +1,260 @@
+"""
+Compare the schema parser with the fast parser of the cms config on a
+synthetic config, and check that both build the same config.
+
+Usage:
+
+    $ python scripts/benchmark_config_parse.py [record types] [fields] \
+        [iterations]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from ruamel.yaml import YAML
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skygear_content_manager.config_builder import build_config  # noqa: E402,E501
+from skygear_content_manager.config_loader import CONFIG_PARSER_FAST  # noqa: E402,E501
+from skygear_content_manager.config_loader import CONFIG_PARSER_SCHEMA  # noqa: E402,E501
+from skygear_content_manager.config_loader import ConfigLoader  # noqa: E402
+from skygear_content_manager.schema.skygear_schema import SkygearSchemaSchema  # noqa: E402,E501
+
+FIELD_TYPES = ['string', 'number', 'integer', 'boolean', 'datetime', 'asset']
+
+
+def record_type_name(i):
+    return 'record_{:04d}'.format(i)
+
+
+def make_schema(record_types, fields):
+    """
+    Record i has `fields` plain fields, a reference to record i - 1 and a
+    reference to itself.
+    """
+    raw_schema = {'record_types': {}}
+    for i in range(record_types):
+        record_fields = [{
+            'name': 'field_{}'.format(j),
+            'type': FIELD_TYPES[j % len(FIELD_TYPES)],
+        } for j in range(fields)]
+        record_fields.append({
+            'name':
+            'previous',
+            'type':
+            'ref({})'.format(record_type_name(max(i - 1, 0))),
+        })
+        record_fields.append({
+            'name': 'parent',
+            'type': 'ref({})'.format(record_type_name(i)),
+        })
+        raw_schema['record_types'][record_type_name(i)] = {
+            'fields': record_fields,
+        }
+
+    raw_schema['record_types']['link'] = {
+        'fields': [{
+            'name': 'from',
+            'type': 'ref({})'.format(record_type_name(0)),
+        }, {
+            'name': 'to',
+            'type': 'ref({})'.format(record_type_name(0)),
+        }],
+    }
+    return SkygearSchemaSchema().load(raw_schema)
+
+
+def make_config(record_types, fields):
+    records = {}
+    imports = {}
+    exports = {}
+    for i in range(record_types):
+        name = record_type_name(i)
+        previous = record_type_name(max(i - 1, 0))
+        records[name] = {'list': {'fields': [{'name': '_id'}]}}
+
+        plain_fields = [{
+            'name': 'field_{}'.format(j),
+            'label': 'Field {}'.format(j),
+        } for j in range(fields)]
+
+        imports['import-' + name] = {
+            'record_type':
+            name,
+            'identifier':
+            'field_0',
+            'handle_duplicated_identifier':
+            'throw_error',
+            'limit': {
+                'record_number': 1000,
+                'file_size': '1MB',
+            },
+            'fields':
+            plain_fields + [{
+                'name': 'previous',
+                'reference_target': previous,
+                'reference_field_name': 'field_0',
+                'handle_duplicated_reference': 'use_first',
+            }],
+        }
+        exports['export-' + name] = {
+            'record_type':
+            name,
+            'fields': [{
+                'name': '_id'
+            }, {
+                'name': '_created_at'
+            }] + plain_fields +
+            [{
+                'name': 'previous',
+                'reference_target': previous,
+                'reference_field_name': 'field_0',
+            }, {
+                'name': 'parent',
+                'reference_target': name,
+                'reference_fields': [
+                    {
+                        'name': '_id'
+                    },
+                    {
+                        'name': 'field_0'
+                    },
+                ],
+            }, {
+                'name':
+                'children',
+                'reference_via_back_reference':
+                name,
+                'reference_from_field':
+                'parent',
+                'reference_fields': [
+                    {
+                        'name': '_id',
+                        'label': 'Child {index} - ID'
+                    },
+                    {
+                        'name': 'field_0'
+                    },
+                ],
+            }],
+        }
+
+    exports['export-links'] = {
+        'record_type':
+        record_type_name(0),
+        'fields': [{
+            'name': 'links',
+            'reference_via_association_record': 'link',
+            'reference_target': record_type_name(0),
+            'reference_field_name': 'field_0',
+        }],
+    }
+
+    config_data = {
+        'site': [{
+            'type': 'record',
+            'name': n
+        } for n in records],
+        'records': records,
+        'association_records': {
+            'link': {
+                'fields': [{
+                    'name': 'from',
+                    'reference_target': record_type_name(0),
+                }, {
+                    'name': 'to',
+                    'reference_target': record_type_name(0),
+                }],
+            },
+        },
+        'imports': imports,
+        'exports': exports,
+    }
+
+    stream = BytesIO()
+    YAML().dump(config_data, stream)
+    return stream.getvalue()
+
+
+def to_data(value):
+    """
+    Turn parsed config objects into comparable data.
+    """
+    if isinstance(value, dict):
+        return {k: to_data(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [to_data(v) for v in value]
+
+    if hasattr(value, '__dict__'):
+        return (type(value).__name__, to_data(vars(value)))
+
+    return value
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn()
+    seconds = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    record_types = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fields = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    schema = make_schema(record_types, fields)
+    content = make_config(record_types, fields)
+
+    schema_loader = ConfigLoader(
+        snapshot_path=None, parser=CONFIG_PARSER_SCHEMA)
+    fast_loader = ConfigLoader(snapshot_path=None, parser=CONFIG_PARSER_FAST)
+
+    # equivalence, build_config raises instead of falling back to the
+    # schemas
+    schema_data = schema_loader._load_config_data(content)
+    fast_data = fast_loader._load_config_data(content)
+    assert fast_data == schema_data
+
+    schema_config = schema_loader.parse_config_file(schema, content)
+    fast_config = build_config(schema, fast_data)
+    assert to_data(fast_config) == to_data(schema_config)
+
+    results = [
+        ('round-trip yaml load',
+         measure(lambda: schema_loader._load_config_data(content),
+                 iterations)),
+        ('safe yaml load',
+         measure(lambda: fast_loader._load_config_data(content), iterations)),
+        ('fast parse',
+         measure(lambda: fast_loader._parse_config(schema, fast_data),
+                 iterations)),
+        # the schemas modify the config data, it is loaded every time
+        ('schema load and parse',
+         measure(lambda: schema_loader.parse_config_file(schema, content),
+                 iterations)),
+        ('fast load and parse',
+         measure(lambda: fast_loader.parse_config_file(schema, content),
+                 iterations)),
+    ]
+
+    print('config: {} record types, {} fields each, {} bytes'.format(
+        record_types, fields, len(content)))
+    print('{:<24} {:>10} {:>12}'.format('', 'time', 'peak memory'))
+    for name, (seconds, peak) in results:
+        print('{:<24} {:7.1f} ms {:9.1f} MB'.format(name, seconds * 1000,
+                                                    peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare the json module with the json_codec module on record:query
+payloads, and check that both decode and encode to the same values.
+
+Usage:
+
+    $ python scripts/benchmark_json_codec.py [records] [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skygear_content_manager import json_codec  # noqa: E402
+
+
+def make_record(i):
+    return {
+        '_id': 'note/{:08d}'.format(i),
+        '_type': 'record',
+        '_created_at': '2018-03-01T12:00:00.{:06d}Z'.format(i % 1000000),
+        '_updated_at': '2018-03-02T12:00:00.000000Z',
+        '_created_by': 'user-{}'.format(i % 50),
+        '_updated_by': 'user-{}'.format(i % 50),
+        '_ownerID': 'user-{}'.format(i % 50),
+        '_access': None,
+        'title': 'Note #{} — 中文'.format(i),
+        'content': 'Lorem ipsum dolor sit amet. ' * 10,
+        'score': i * 1.5,
+        'count': i,
+        'published': i % 2 == 0,
+        'tags': ['tag-{}'.format(j) for j in range(i % 5)],
+        'published_at': {
+            '$type': 'date',
+            '$date': '2018-03-03T12:00:00.000000Z',
+        },
+        'category': {
+            '$type': 'ref',
+            '$id': 'category/{}'.format(i % 20),
+        },
+        'location': {
+            '$type': 'geo',
+            '$lat': 22.3,
+            '$lng': 114.2,
+        },
+        'cover': {
+            '$type': 'asset',
+            '$name': 'cover-{}.png'.format(i),
+            '$url': 'http://localhost:3000/files/cover-{}.png'.format(i),
+        },
+        '_transient': {},
+    }
+
+
+def make_payload(count):
+    return {
+        'result': [make_record(i) for i in range(count)],
+        'info': {
+            'count': count,
+        },
+    }
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    payload = make_payload(count)
+    stdlib_bytes = json.dumps(payload).encode('utf-8')
+    codec_bytes = json_codec.dumps_bytes(payload)
+
+    # equivalence
+    assert json.loads(codec_bytes.decode('utf-8')) == payload
+    assert json_codec.loads(stdlib_bytes) == payload
+    assert json_codec.loads(codec_bytes) == json.loads(
+        stdlib_bytes.decode('utf-8'))
+
+    results = [
+        ('json.loads', measure(
+            lambda: json.loads(stdlib_bytes.decode('utf-8')), iterations)),
+        ('json_codec.loads', measure(
+            lambda: json_codec.loads(stdlib_bytes), iterations)),
+        ('json.dumps', measure(
+            lambda: json.dumps(payload).encode('utf-8'), iterations)),
+        ('json_codec.dumps_bytes', measure(
+            lambda: json_codec.dumps_bytes(payload), iterations)),
+    ]
+
+    print('codec: {}'.format(json_codec.codec_name))
+    print('payload: {} records, {} bytes'.format(count, len(stdlib_bytes)))
+    for name, seconds in results:
+        print('{:<24} {:8.2f} ms'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure the plugin CPU time spent per cms-api/ proxy request before the
+request is sent upstream, with and without the verified token cache.
+
+Usage:
+
+    $ python scripts/benchmark_proxy_auth.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skygear.options import options  # noqa: E402
+
+from skygear_content_manager import skygear_utils  # noqa: E402
+
+options.skygear_endpoint = 'http://localhost:3000/'
+options.masterkey = 'FAKE_MASTER_KEY'
+
+
+def make_request(cms_token):
+    body = {
+        'action': 'record:query',
+        'record_type': 'note',
+        'database_id': '_public',
+        'limit': 25,
+        'access_token': cms_token,
+    }
+    builder = EnvironBuilder(
+        method='POST',
+        path='/cms-api/',
+        headers={'Content-Type': 'application/json'},
+        data=json.dumps(body).encode('utf-8'))
+    return Request(builder.get_environ())
+
+
+def proxy_path(request, verify):
+    req = skygear_utils.SkygearRequest.from_werkzeug(request)
+    req.body.data.get('action')
+    authdata = verify(req.access_token)
+    req.access_token = authdata.skygear_token
+    req.is_master = authdata.is_admin
+    return req.to_requests().prepare()
+
+
+def measure(request, verify, iterations):
+    start = time.process_time()
+    for i in range(iterations):
+        proxy_path(request, verify)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    AuthData = skygear_utils.AuthData
+    cms_token = AuthData(
+        is_admin=True,
+        skygear_token='skygear-token',
+        expire_at=datetime.utcnow().timestamp() + 3600,
+    ).to_cms_token()
+    request = make_request(cms_token)
+    skygear_utils.verified_token_cache.clear()
+
+    uncached = measure(request, AuthData.decode_cms_token, iterations)
+    cached = measure(request, AuthData.from_cms_token, iterations)
+
+    print('iterations: {}'.format(iterations))
+    print('without token cache: {:.1f} us/request'.format(uncached * 1e6))
+    print('with token cache:    {:.1f} us/request'.format(cached * 1e6))
+
+
+if __name__ == '__main__':
+    main()
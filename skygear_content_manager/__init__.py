@@ -1,25 +1,41 @@
+import hashlib
 import logging
 from datetime import datetime
 from math import floor
 
 import skygear
-from ruamel.yaml import YAML
+from skygear.error import PermissionDenied
 from skygear.options import options
 
+from . import deadline
+from . import metrics
+from . import warm_up
 from .cms_index_html import INDEX_HTML_FORMAT
+from .compression import accepts_gzip
+from .config_invalidation import InvalidationListener
+from .config_invalidation import publish_invalidation
+from .config_loader import RELOAD_SCHEMA
+from .config_loader import RELOAD_SOURCE
 from .config_loader import ConfigLoader
+from .config_loader import is_file_source
 from .db import cms_db_init
 from .file_import import register_lambda as register_file_import_lambda
-from .generate_config import generate_config
 from .import_export import register_lambdas as register_import_export_lambdas
+from .lru_cache import LRUCache
+from .proxy_cache import ProxyResponseCache
 from .push_notifications import \
     register_lambda as register_push_notifications_lambda
-from .schema.skygear_schema import SkygearSchemaSchema
 from .settings import CLIENT_SKYGEAR_ENDPOINT
 from .settings import CMS_AUTH_TOKEN_EXPIRY
+from .settings import CMS_BATCH_MAX_ACTIONS
 from .settings import CMS_CONFIG_FILE_URL
+from .settings import CMS_CONFIG_INVALIDATION_ENABLED
 from .settings import CMS_IMPORT_BATCH_SIZE
+from .settings import CMS_ME_CACHE_MAX_AGE
+from .settings import CMS_ME_CACHE_SIZE
+from .settings import CMS_PROXY_STREAMING
 from .settings import CMS_PUBLIC_URL
+from .settings import CMS_REQUEST_DEADLINE
 from .settings import CMS_SITE_TITLE
 from .settings import CMS_SKYGEAR_API_KEY
 from .settings import CMS_SKYGEAR_ENDPOINT
@@ -28,14 +44,24 @@ from .settings import CMS_THEME_LOGO
 from .settings import CMS_THEME_PRIMARY_COLOR
 from .settings import CMS_THEME_SIDEBAR_COLOR
 from .settings import CMS_USER_PERMITTED_ROLE
+from .settings import CMS_WARM_UP
+from .skygear_async_utils import gather
+from .skygear_async_utils import run_in_executor
+from .skygear_async_utils import run_sync
 from .skygear_utils import AuthData
+from .skygear_utils import Body
 from .skygear_utils import SkygearRequest
 from .skygear_utils import SkygearResponse
-from .skygear_utils import get_schema
+from .skygear_utils import is_coalescable
 from .skygear_utils import request_skygear
+from .skygear_utils import request_skygear_coalesced
+from .skygear_utils import upstream_flight
 from .skygear_utils import validate_master_user
+from .skygear_utils import verified_token_cache
+from .upstream import UpstreamTransport
 from .user import register_lambdas as register_user_lambdas
 from .werkzeug_utils import prepare_file_response
+from .werkzeug_utils import set_etag
 
 logger = logging.getLogger(__name__)
 try:
@@ -45,6 +71,9 @@ try:
 except ImportError:
     pass
 
+# results of intercepted me calls, by skygear token
+me_cache = LRUCache(ttl=CMS_ME_CACHE_MAX_AGE, max_entries=CMS_ME_CACHE_SIZE)
+
 
 def includeme(settings):
     register_cms_config_lambdas(settings)
@@ -52,15 +81,30 @@ def includeme(settings):
     register_file_import_lambda(settings)
     register_import_export_lambdas(settings)
     register_cms_proxy_handler(settings)
+    register_cms_batch_handler(settings)
     register_user_lambdas(settings)
+    register_stats_handler(settings)
+    register_metrics_handler(settings)
 
     @skygear.event("before-plugins-ready")
     def before_plugins_ready(config):
         cms_db_init(config)
+        config_loader = ConfigLoader.get_instance()
+        if config_loader.state is not None:
+            # loaded from snapshot
+            config_loader.start_revalidation()
+        if CMS_WARM_UP:
+            # the plugin is reported ready after this event
+            warm_up.warm_up()
+        config_loader.start_refresher()
+        if CMS_CONFIG_INVALIDATION_ENABLED:
+            InvalidationListener(invalidate_config).start()
 
     @skygear.event('schema-changed')
     def schema_change(config):
-        ConfigLoader.get_instance().reset_schema()
+        invalidate_config([RELOAD_SCHEMA])
+        if CMS_CONFIG_INVALIDATION_ENABLED:
+            publish_invalidation([RELOAD_SCHEMA])
 
     @skygear.handler('cms/')
     def index(request):
@@ -100,51 +144,319 @@ def register_cms_proxy_handler(settings):
         # log_request(request)
 
         req = SkygearRequest.from_werkzeug(request)
+        with metrics.time_proxy_request(req.action):
+            resp = handle_proxy_request(req)
+            return resp.to_werkzeug(accept_gzip=accepts_gzip(request.headers))
+
+
+def handle_proxy_request(req, stream=CMS_PROXY_STREAMING):
+    if req.body.is_dict:
+        if req.body.data.get('action') == 'auth:login':
+            return intercept_login(req)
+        elif req.body.data.get('action') == 'asset:put':
+            return intercept_asset_put(req)
+
+    cms_access_token = req.access_token
+    if not cms_access_token:
+        return proxy_request(req, stream)
+
+    authdata = AuthData.from_cms_token(cms_access_token)
+    if not authdata:
+        return SkygearResponse.access_token_not_accepted()
+
+    req.access_token = authdata.skygear_token
+
+    if req.body.is_dict:
+        if req.body.data.get('action') == 'me':
+            return intercept_me(req, authdata)
+        elif req.body.data.get('action') == 'auth:logout':
+            me_cache.delete(me_cache_key(authdata.skygear_token))
+
+    if not authdata.is_admin:
+        return proxy_request(req, stream)
+
+    req.is_master = True
+    return proxy_request(req, stream)
+
+
+def proxy_request(req, stream=CMS_PROXY_STREAMING):
+    """
+    Send a request that the plugin does not need to inspect.
+
+    Responses of cacheable actions are served from the proxy response cache
+    when possible. Concurrent identical read requests share one upstream
+    call. Other responses are streamed.
+    """
+    cache = ProxyResponseCache.get_instance()
+    is_cacheable = cache.is_cacheable(req)
+    if is_cacheable:
+        resp = cache.get(req)
+        if resp is not None:
+            return resp
+
+    if is_coalescable(req):
+        resp = request_skygear_coalesced(req)
+    else:
+        resp = request_skygear(req, stream=stream and not is_cacheable)
+
+    if is_cacheable:
+        cache.set(req, resp)
+        return resp
+
+    try:
+        cache.invalidate_for(req)
+    except Exception:
+        # release the upstream connection of a streamed response
+        if resp.stream:
+            resp.stream.close()
+        raise
+
+    return resp
+
+
+def register_cms_batch_handler(settings):
+    @skygear.handler('cms-api/batch')
+    def batch(request):
+        """
+        Execute an ordered list of actions in one request.
+
+        The request body is a JSON array of action payloads, as would be
+        sent to cms-api/. Each action is authorized the same way as in
+        cms-api/. The response is {"result": [...]} with one
+        {"status": ..., "body": ...} per action, in the same order.
+        """
+        body = Body(request.data)
+        if not body.is_json or not isinstance(body.data, list) or \
+           not all(isinstance(d, dict) for d in body.data):
+            return skygear.Response('Invalid batch request', 400)
+
+        if len(body.data) > CMS_BATCH_MAX_ACTIONS:
+            return skygear.Response(
+                'Batch request exceeds {} actions'.format(
+                    CMS_BATCH_MAX_ACTIONS), 400)
+
+        headers = {k: v for k, v in request.headers}
+        reqs = [
+            SkygearRequest(request.method, dict(headers), Body(data))
+            for data in body.data
+        ]
+        with deadline.deadline(CMS_REQUEST_DEADLINE):
+            resps = run_sync(handle_batch_requests(reqs))
+
+        cookies = {}
+        for resp in resps:
+            if resp.cookies:
+                cookies.update(resp.cookies.items())
+
+        result = {'result': [batch_result(resp) for resp in resps]}
+        resp = SkygearResponse(
+            status_code=200,
+            headers={'Content-Type': 'application/json'},
+            cookies=cookies,
+            body=Body(result),
+        )
+        return resp.to_werkzeug(accept_gzip=accepts_gzip(request.headers))
+
+
+async def handle_batch_requests(reqs):
+    """
+    Handle the requests of a batch and return the responses in order.
+
+    Consecutive read-only actions run concurrently. Any other action runs
+    alone, after every action before it completes.
+    """
+    transport = UpstreamTransport.get_instance()
+    stages = []
+    for req in reqs:
+        is_read = transport.is_idempotent(req.action)
+        if is_read and stages and stages[-1][0]:
+            stages[-1][1].append(req)
+        else:
+            stages.append((is_read, [req]))
 
-        if req.body.is_dict:
-            if req.body.data.get('action') == 'auth:login':
-                return intercept_login(req).to_werkzeug()
-            elif req.body.data.get('action') == 'asset:put':
-                return intercept_asset_put(req).to_werkzeug()
+    resps = []
+    for is_read, stage_reqs in stages:
+        resps = resps + await gather(
+            [run_in_executor(handle_batch_request, req) for req in stage_reqs])
 
-        cms_access_token = req.access_token
-        if not cms_access_token:
-            return request_skygear(req).to_werkzeug()
+    return resps
 
-        authdata = AuthData.from_cms_token(cms_access_token)
-        if not authdata:
-            return SkygearResponse.access_token_not_accepted().to_werkzeug()
 
-        req.access_token = authdata.skygear_token
+# req: SkygearRequest
+def handle_batch_request(req):
+    with metrics.time_proxy_request(req.action):
+        return handle_proxy_request(req, False)
 
-        if req.body.is_dict:
-            if req.body.data.get('action') == 'me':
-                return intercept_me(req).to_werkzeug()
 
-        if not authdata.is_admin:
-            return request_skygear(req).to_werkzeug()
+# resp: SkygearResponse
+def batch_result(resp):
+    if resp.error_code:
+        return {
+            'status': SkygearResponse.error_status_code(resp.error_code),
+            'body': SkygearResponse.error_dict(resp.error_code),
+        }
+
+    if resp.body.is_json:
+        body = resp.body.data
+    else:
+        body = (resp.body.to_data() or b'').decode('utf-8', 'replace')
 
-        req.is_master = True
-        return request_skygear(req).to_werkzeug()
+    return {
+        'status': resp.status_code,
+        'body': body,
+    }
 
 
 def register_cms_config_lambdas(settings):
     @skygear.handler('cms-api/default-cms-config.yaml')
     def default_cms_config(request):
-        schema = SkygearSchemaSchema().load(get_schema())
-        default_config = generate_config(schema)
-        response = prepare_file_response('cms-config.yaml', 'text/yaml')
-        yaml = YAML()
-        yaml.dump(default_config, response.stream)
-        return response
+        data, etag = ConfigLoader.get_instance().get_default_config_file()
+        return config_file_response(request, data, etag)
+
+    @skygear.handler('cms-api/cms-config.yaml')
+    def cms_config_file(request):
+        """
+        Serve the config of a file:// config source to the CMS client.
+        """
+        config_loader = ConfigLoader.get_instance()
+        if not is_file_source(config_loader.config_source):
+            return skygear.Response('Config file not found', 404)
+
+        data, etag = config_loader.get_config_file()
+        return config_file_response(request, data, etag)
+
+    @skygear.handler('cms-api/config.json')
+    def cms_config_json(request):
+        """
+        Serve the config to the CMS client in JSON, so that the client does
+        not parse YAML.
+        """
+        config_json = ConfigLoader.get_instance().get_config_json()
+        if accepts_gzip(request.headers):
+            return config_json_response(request, config_json.gzip_bytes,
+                                        config_json.etag + '-gzip', 'gzip')
+
+        return config_json_response(request, config_json.json_bytes,
+                                    config_json.etag)
 
     @skygear.handler('cms-api/reload-cms-config')
     def cms_config_file_url_api(request):
         validate_master_user()
-        ConfigLoader.get_instance().set_config_source(CMS_CONFIG_FILE_URL)
+        invalidate_config([RELOAD_SOURCE])
+        if CMS_CONFIG_INVALIDATION_ENABLED:
+            publish_invalidation([RELOAD_SOURCE])
         return {'result': 'OK'}
 
 
+def invalidate_config(reasons):
+    """
+    Reload the config source or the schema, as requested in this process
+    or published by another one.
+    """
+    if RELOAD_SCHEMA in reasons:
+        ConfigLoader.get_instance().reset_schema()
+        ProxyResponseCache.get_instance().invalidate_schema()
+
+    if RELOAD_SOURCE in reasons:
+        ConfigLoader.get_instance().set_config_source(CMS_CONFIG_FILE_URL)
+
+
+def config_file_response(request, data, etag):
+    if request.if_none_match.contains(etag):
+        response = skygear.Response(status=304)
+    else:
+        response = prepare_file_response('cms-config.yaml', 'text/yaml')
+        response.set_data(data)
+
+    set_etag(response, etag)
+    # revalidate with the ETag every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def config_json_response(request, data, etag, content_encoding=None):
+    if request.if_none_match.contains(etag):
+        response = skygear.Response(status=304)
+    else:
+        response = skygear.Response(data, content_type='application/json')
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+
+    set_etag(response, etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # revalidate with the ETag every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def register_stats_handler(settings):
+    @skygear.handler('cms-api/stats')
+    def stats(request):
+        validate_master_user()
+        return {
+            'upstream_pool': UpstreamTransport.get_instance().stats(),
+            'proxy_cache': ProxyResponseCache.get_instance().stats(),
+            'coalescing': upstream_flight.stats(),
+            'auth_token_cache': verified_token_cache.stats(),
+            'me_cache': me_cache.stats(),
+            'warm_up': warm_up.get_warm_up_status(),
+        }
+
+
+def register_metrics_handler(settings):
+    metrics.registry.register_collector(collect_stats_metrics)
+
+    @skygear.handler('cms-api/metrics')
+    def metrics_handler(request):
+        validate_master_user()
+        return skygear.Response(
+            metrics.registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
+
+
+def collect_stats_metrics():
+    """
+    Report the stats of the upstream pool and the caches as metrics.
+    """
+    pool = UpstreamTransport.get_instance().stats()
+    proxy_cache = ProxyResponseCache.get_instance().stats()
+    coalescing = upstream_flight.stats()
+    token_cache = verified_token_cache.stats()
+    me_cache_stats = me_cache.stats()
+    return [
+        ('cms_upstream_pool_size', 'gauge', 'Upstream connection slots.',
+         [({}, pool['pool_size'])]),
+        ('cms_upstream_pool_in_use', 'gauge',
+         'Upstream connection slots in use.', [({}, pool['in_use'])]),
+        ('cms_upstream_pool_waits_total', 'counter',
+         'Upstream requests that waited for a connection slot.',
+         [({}, pool['waits'])]),
+        ('cms_upstream_retries_total', 'counter', 'Retried upstream requests.',
+         [({}, pool['retries'])]),
+        ('cms_upstream_breaker_open', 'gauge',
+         'Whether requests to skygear server are being rejected.',
+         [({}, pool.get('breaker', {}).get('state') == 'open')]),
+        ('cms_proxy_cache_hits_total', 'counter', 'Proxy cache hits.',
+         [({}, proxy_cache['hits'])]),
+        ('cms_proxy_cache_misses_total', 'counter', 'Proxy cache misses.',
+         [({}, proxy_cache['misses'])]),
+        ('cms_proxy_cache_bytes', 'gauge', 'Size of the proxy cache.',
+         [({}, proxy_cache['size'])]),
+        ('cms_proxy_coalesced_total', 'counter',
+         'Requests that shared an in-flight upstream call.',
+         [({}, coalescing['coalesced'])]),
+        ('cms_auth_token_cache_hits_total', 'counter',
+         'Verified token cache hits.', [({}, token_cache['hits'])]),
+        ('cms_auth_token_cache_misses_total', 'counter',
+         'Verified token cache misses.', [({}, token_cache['misses'])]),
+        ('cms_me_cache_hits_total', 'counter', 'Cached me responses served.',
+         [({}, me_cache_stats['hits'])]),
+        ('cms_me_cache_misses_total', 'counter',
+         'me calls sent to skygear server.', [({}, me_cache_stats['misses'])]),
+    ]
+
+
 def intercept_login(req):
     resp = request_skygear(req)
 
@@ -188,11 +500,40 @@ def intercept_asset_put(req):
 
     resp.body.data['result']['post-request']['action'] = \
         endpoint + action_url[1:]
+    resp.body.mark_modified()
+
+    return resp
+
+
+# authdata: AuthData
+def intercept_me(req, authdata):
+    """
+    Serve repeated me calls of a skygear token from me_cache.
+
+    Both granted and denied responses are cached, until the cms token
+    expires, CMS_ME_CACHE_MAX_AGE passes or the token is logged out.
+    """
+    key = me_cache_key(authdata.skygear_token)
+    resp = me_cache.get(key)
+    if resp is not None:
+        return resp.copy()
+
+    resp = request_me(req)
+    if resp.error_code == PermissionDenied or \
+       (not resp.error_code and 200 <= resp.status_code <= 299):
+        ttl = min(CMS_ME_CACHE_MAX_AGE,
+                  authdata.expire_at - datetime.utcnow().timestamp())
+        if ttl > 0:
+            me_cache.set(key, resp.copy(), ttl=ttl)
 
     return resp
 
 
-def intercept_me(req):
+def me_cache_key(skygear_token):
+    return hashlib.sha256(str(skygear_token).encode('utf-8')).digest()
+
+
+def request_me(req):
     resp = request_skygear(req)
 
     if not (200 <= resp.status_code <= 299):
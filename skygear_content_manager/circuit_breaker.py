@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a failing service for a while.
+
+    The outcomes of the most recent `window` calls are kept. A call fails
+    if it raises or times out, slow calls that succeed are not failures.
+    Once at least min_calls outcomes are known and the failure rate reaches
+    failure_rate, the circuit opens and calls are rejected for
+    open_duration seconds. After that a single trial call is let through,
+    the circuit closes if it succeeds and opens again otherwise.
+    """
+
+    def __init__(self,
+                 window,
+                 min_calls,
+                 failure_rate,
+                 open_duration,
+                 name='circuit'):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_duration = open_duration
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._failures = 0
+        self._state = STATE_CLOSED
+        self._opened_at = None
+        # the trial call of the half open circuit
+        self._trial = None
+        self._rejected = 0
+        self._opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the call should not be made.
+
+        Return a token of the call allowed, every call allowed must be
+        followed by after_call with the token.
+        """
+        with self._lock:
+            call = object()
+            if self._state == STATE_CLOSED:
+                return call
+
+            if self._state == STATE_OPEN and \
+               time.monotonic() - self._opened_at >= self.open_duration:
+                self._state = STATE_HALF_OPEN
+
+            if self._state == STATE_HALF_OPEN and self._trial is None:
+                self._trial = call
+                return call
+
+            self._rejected = self._rejected + 1
+            raise CircuitOpenError('Circuit {} is open'.format(self.name))
+
+    def after_call(self, call, failed=False):
+        with self._lock:
+            if call is self._trial:
+                # only the trial call decides the half open circuit
+                self._trial = None
+                if failed:
+                    self._open()
+                else:
+                    self._close()
+                return
+
+            if self._state != STATE_CLOSED:
+                # calls allowed before the circuit opened
+                return
+
+            if len(self._outcomes) == self._outcomes.maxlen and \
+               self._outcomes[0]:
+                self._failures = self._failures - 1
+            self._outcomes.append(failed)
+            if failed:
+                self._failures = self._failures + 1
+
+            if len(self._outcomes) >= self.min_calls and \
+               self._failures >= self.failure_rate * len(self._outcomes):
+                self._open()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'calls': len(self._outcomes),
+                'failures': self._failures,
+                'opened': self._opened,
+                'rejected': self._rejected,
+            }
+
+    def _open(self):
+        if self._state != STATE_OPEN:
+            logger.warning('Circuit %s is open', self.name)
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._opened = self._opened + 1
+
+    def _close(self):
+        logger.info('Circuit %s is closed', self.name)
+        self._state = STATE_CLOSED
+        self._outcomes.clear()
+        self._failures = 0
@@ -0,0 +1,98 @@
+import zlib
+
+from .settings import CMS_PROXY_GZIP
+from .settings import CMS_PROXY_GZIP_LEVEL
+from .settings import CMS_PROXY_GZIP_MIN_SIZE
+
+COMPRESSIBLE_CONTENT_TYPES = [
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'text/',
+]
+
+
+def accepts_gzip(headers):
+    """
+    Whether the client accepts gzip content encoding, according to the
+    Accept-Encoding request header.
+    """
+    if not CMS_PROXY_GZIP:
+        return False
+
+    accept_encoding = headers.get('Accept-Encoding') or ''
+    for coding in accept_encoding.split(','):
+        parts = [p.strip() for p in coding.split(';')]
+        if parts[0].lower() not in ('gzip', '*'):
+            continue
+
+        return quality_of(parts[1:]) > 0
+
+    return False
+
+
+def quality_of(params):
+    for param in params:
+        name, _, value = param.partition('=')
+        if name.strip().lower() != 'q':
+            continue
+
+        try:
+            return float(value)
+        except ValueError:
+            return 0
+
+    return 1
+
+
+def is_compressible(content_type, content_length=None):
+    """
+    Whether a response should be compressed.
+
+    content_length is None if the length is not known in advance.
+    """
+    if content_length is not None and \
+       content_length < CMS_PROXY_GZIP_MIN_SIZE:
+        return False
+
+    content_type = (content_type or '').lower()
+    return any(
+        content_type.startswith(t) or content_type.endswith('+json')
+        for t in COMPRESSIBLE_CONTENT_TYPES)
+
+
+def gzip_compressor():
+    return zlib.compressobj(CMS_PROXY_GZIP_LEVEL, zlib.DEFLATED,
+                            16 + zlib.MAX_WBITS)
+
+
+def gzip_data(data):
+    compressor = gzip_compressor()
+    return compressor.compress(data) + compressor.flush()
+
+
+class GzipStream:
+    """
+    Compress an iterable of bytes chunk by chunk.
+
+    close() is passed to the underlying iterable.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        compressor = gzip_compressor()
+        try:
+            for chunk in self.chunks:
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
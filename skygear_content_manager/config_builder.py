@@ -0,0 +1,371 @@
+import humanfriendly
+
+from .models.cms_config import DISPLAY_MODE_GROUPED
+from .models.cms_config import DISPLAY_MODE_SPREAD
+from .models.cms_config import DUPLICATION_HANDLING_THROW_ERROR
+from .models.cms_config import DUPLICATION_HANDLING_USE_FIRST
+from .models.cms_config import CMSAssociationRecord
+from .models.cms_config import CMSAssociationRecordField
+from .models.cms_config import CMSConfig
+from .models.cms_config import CMSRecord
+from .models.cms_config import CMSRecordAssociationReference
+from .models.cms_config import CMSRecordBackReference
+from .models.cms_config import CMSRecordDirectReference
+from .models.cms_config import CMSRecordExport
+from .models.cms_config import CMSRecordExportField
+from .models.cms_config import CMSRecordImport
+from .models.cms_config import CMSRecordImportField
+from .models.cms_config import CMSRecordImportLimitConfig
+
+# Keys accepted by the schemas in schema/cms_config.py, and the keys of
+# them that must be strings. The name of an import or export, and the
+# record type of their fields, are overwritten by the schemas.
+EXPORT_KEYS = frozenset(['record_type', 'name', 'fields'])
+EXPORT_STRING_KEYS = frozenset(['record_type'])
+EXPORT_FIELD_STRING_KEYS = frozenset([
+    'name',
+    'label',
+    'format',
+    'reference_target',
+    'reference_field_name',
+    'reference_via_back_reference',
+    'reference_from_field',
+    'reference_via_association_record',
+])
+EXPORT_FIELD_KEYS = EXPORT_FIELD_STRING_KEYS | \
+    frozenset(['record_type', 'reference_fields'])
+IMPORT_STRING_KEYS = frozenset([
+    'record_type',
+    'identifier',
+    'handle_duplicated_identifier',
+])
+IMPORT_KEYS = IMPORT_STRING_KEYS | frozenset(['name', 'limit', 'fields'])
+IMPORT_LIMIT_KEYS = frozenset(['record_number', 'file_size'])
+IMPORT_FIELD_STRING_KEYS = frozenset([
+    'name',
+    'label',
+    'reference_target',
+    'reference_field_name',
+    'handle_duplicated_reference',
+])
+IMPORT_FIELD_KEYS = IMPORT_FIELD_STRING_KEYS | frozenset(['record_type'])
+ASSOCIATION_RECORD_KEYS = frozenset(['record_type', 'fields'])
+
+DUPLICATION_HANDLINGS = frozenset(
+    [DUPLICATION_HANDLING_USE_FIRST, DUPLICATION_HANDLING_THROW_ERROR])
+
+
+class UnsupportedConfig(Exception):
+    """
+    Raised for config data that the builder does not handle, e.g. invalid
+    values. Such config data is left to the schemas, which report the
+    errors.
+    """
+    pass
+
+
+def build_config(schema, config_data):
+    """
+    Build the CMSConfig of config data, like CMSConfigSchema does but
+    without marshmallow. config_data is not modified.
+    """
+    cms_records = build_cms_records(get_dict(config_data, 'records'))
+    association_records = build_association_records(
+        get_dict(config_data, 'association_records'), cms_records)
+
+    builder = ConfigBuilder(schema, cms_records, association_records)
+    return builder.build_config(config_data)
+
+
+def build_cms_records(records_data):
+    cms_records = {}
+    for key, value in records_data.items():
+        record_type = value.get('record_type', key)
+        cms_records[key] = CMSRecord(name=key, record_type=record_type)
+
+    return cms_records
+
+
+def build_association_records(association_records_data, cms_records):
+    association_records = {}
+    for key, value in association_records_data.items():
+        check_keys(value, ASSOCIATION_RECORD_KEYS)
+        association_records[key] = CMSAssociationRecord(
+            name=key,
+            record_type=get_string(value, 'record_type', key),
+            fields=[
+                CMSAssociationRecordField(
+                    name=get_string(field, 'name'),
+                    target_cms_record=cms_records[get_string(
+                        field, 'reference_target')],
+                ) for field in get_list(value, 'fields')
+            ],
+        )
+
+    return association_records
+
+
+class ConfigBuilder:
+    """
+    Build the imports and exports of config data with the given records and
+    association records.
+    """
+
+    def __init__(self, schema, cms_records, association_records):
+        self.schema = schema
+        self.cms_records = cms_records
+        self.association_records = association_records
+
+    def build_config(self, config_data):
+        imports = get_dict(config_data, 'imports')
+        exports = get_dict(config_data, 'exports')
+        return CMSConfig(
+            imports={
+                check_string(k): self.build_import(k, v)
+                for k, v in imports.items()
+            },
+            exports={
+                check_string(k): self.build_export(k, v)
+                for k, v in exports.items()
+            },
+            cms_records=self.cms_records,
+            association_records=self.association_records,
+        )
+
+    def build_export(self, name, data):
+        check_keys(data, EXPORT_KEYS, EXPORT_STRING_KEYS)
+        record_type = get_string(data, 'record_type')
+        return CMSRecordExport(
+            record_type=record_type,
+            name=name,
+            fields=[
+                self.build_export_field(record_type, f)
+                for f in get_list(data, 'fields')
+            ],
+        )
+
+    def build_export_field(self, record_type, data):
+        check_keys(data, EXPORT_FIELD_KEYS, EXPORT_FIELD_STRING_KEYS)
+        name = get_string(data, 'name')
+        label = get_string(data, 'label', name)
+        format = get_string(data, 'format', None)
+
+        reference_fields = None
+        if 'reference_fields' in data:
+            if 'reference_via_back_reference' in data:
+                cms_record = self.cms_records[data[
+                    'reference_via_back_reference']]
+            else:
+                cms_record = self.cms_records[data['reference_target']]
+
+            reference_fields = [
+                self.build_export_field(cms_record.record_type, f)
+                for f in get_list(data, 'reference_fields')
+            ]
+
+        field = self.schema.field_of(record_type, name)
+
+        type = 'reference'
+        reference = None
+        if field and field.is_ref:
+            cms_record = self.cms_records[get_string(data, 'reference_target')]
+            ref_many_fields, ref_target_fields = \
+                self.build_reference_target_fields(
+                    data, cms_record, label, reference_fields)
+            reference = CMSRecordDirectReference(
+                target_cms_record=cms_record,
+                target_fields=ref_target_fields,
+                many_fields=ref_many_fields,
+                display_mode=get_display_mode(ref_many_fields),
+            )
+        elif field:
+            type = field.type
+        elif 'reference_via_back_reference' in data:
+            cms_record = self.cms_records[get_string(
+                data, 'reference_via_back_reference')]
+            ref_many_fields, ref_target_fields = \
+                self.build_reference_target_fields(
+                    data, cms_record, label, reference_fields)
+            reference = CMSRecordBackReference(
+                source_reference=get_string(data, 'reference_from_field'),
+                target_cms_record=cms_record,
+                target_fields=ref_target_fields,
+                display_mode=get_display_mode(ref_many_fields),
+            )
+        elif 'reference_via_association_record' in data:
+            target_reference = get_string(data, 'reference_target')
+            cms_record = self.cms_records[target_reference]
+            ref_many_fields, ref_target_fields = \
+                self.build_reference_target_fields(
+                    data, cms_record, label, reference_fields)
+            reference = CMSRecordAssociationReference(
+                association_record=self.association_records[get_string(
+                    data, 'reference_via_association_record')],
+                target_reference=target_reference,
+                target_cms_record=cms_record,
+                target_fields=ref_target_fields,
+                display_mode=get_display_mode(ref_many_fields),
+            )
+        else:
+            raise UnsupportedConfig('field not found in schema')
+
+        return CMSRecordExportField(
+            record_type=record_type,
+            name=name,
+            label=label,
+            type=type,
+            format=format,
+            reference=reference,
+        )
+
+    def build_reference_target_fields(self, data, target_cms_record, label,
+                                      reference_fields):
+        if 'reference_field_name' in data:
+            record_type = target_cms_record.record_type
+            field_name = get_string(data, 'reference_field_name')
+            foreign_field = self.schema.field_of(record_type, field_name)
+            if not foreign_field:
+                raise UnsupportedConfig('field not found in schema')
+
+            return False, [
+                CMSRecordExportField(
+                    record_type=record_type,
+                    name=field_name,
+                    label=label,
+                    type=foreign_field.type)
+            ]
+
+        if reference_fields is not None:
+            return True, reference_fields
+
+        raise UnsupportedConfig('reference field requires target fields')
+
+    def build_import(self, name, data):
+        check_keys(data, IMPORT_KEYS, IMPORT_STRING_KEYS)
+        record_type = get_string(data, 'record_type')
+
+        kwargs = {}
+        if 'identifier' in data:
+            kwargs['identifier'] = get_string(data, 'identifier')
+        if 'handle_duplicated_identifier' in data:
+            kwargs['handle_duplicated_identifier'] = \
+                get_duplication_handling(data, 'handle_duplicated_identifier')
+        if 'limit' in data:
+            kwargs['limit'] = self.build_import_limit(data['limit'])
+
+        return CMSRecordImport(
+            record_type=record_type,
+            name=name,
+            fields=[
+                self.build_import_field(record_type, f)
+                for f in get_list(data, 'fields')
+            ],
+            **kwargs)
+
+    def build_import_limit(self, data):
+        check_keys(data, IMPORT_LIMIT_KEYS)
+
+        kwargs = {}
+        if 'record_number' in data:
+            record_number = data['record_number']
+            if not isinstance(record_number, int) or \
+               isinstance(record_number, bool):
+                raise UnsupportedConfig('record_number is not an integer')
+            kwargs['record_number'] = record_number
+        if 'file_size' in data:
+            kwargs['file_size'] = humanfriendly.parse_size(
+                get_string(data, 'file_size'))
+
+        return CMSRecordImportLimitConfig(**kwargs)
+
+    def build_import_field(self, record_type, data):
+        check_keys(data, IMPORT_FIELD_KEYS, IMPORT_FIELD_STRING_KEYS)
+        name = get_string(data, 'name')
+
+        kwargs = {}
+        if 'handle_duplicated_reference' in data:
+            kwargs['handle_duplicated_reference'] = \
+                get_duplication_handling(data, 'handle_duplicated_reference')
+
+        field = self.schema.field_of(record_type, name)
+        if not field:
+            raise UnsupportedConfig('field not found in schema')
+
+        type = field.type
+        reference = None
+        if field.is_ref:
+            type = 'reference'
+
+            cms_record = self.cms_records[get_string(data, 'reference_target')]
+            field_name = get_string(data, 'reference_field_name')
+            foreign_field = self.schema.field_of(cms_record.record_type,
+                                                 field_name)
+            if not foreign_field:
+                raise UnsupportedConfig('field not found in schema')
+
+            reference = CMSRecordDirectReference(
+                target_cms_record=cms_record, target_fields=[foreign_field])
+
+        return CMSRecordImportField(
+            record_type=record_type,
+            name=name,
+            label=get_string(data, 'label', name),
+            type=type,
+            reference=reference,
+            **kwargs)
+
+
+def get_display_mode(many_fields):
+    return DISPLAY_MODE_SPREAD if many_fields else DISPLAY_MODE_GROUPED
+
+
+def check_keys(data, keys, string_keys=frozenset()):
+    if not isinstance(data, dict) or not keys.issuperset(data):
+        raise UnsupportedConfig('unexpected keys')
+
+    for key in string_keys.intersection(data):
+        check_string(data[key])
+
+
+def check_string(value):
+    if not isinstance(value, str):
+        raise UnsupportedConfig('{!r} is not a string'.format(value))
+
+    return value
+
+
+def get_string(data, key, *default):
+    """
+    Return the string at key, or default if there is no such key.
+    """
+    if key not in data and default:
+        return default[0]
+
+    return check_string(data[key])
+
+
+def get_duplication_handling(data, key):
+    value = get_string(data, key)
+    if value and value not in DUPLICATION_HANDLINGS:
+        raise UnsupportedConfig('invalid duplication handling')
+
+    return value
+
+
+def get_list(data, key):
+    value = data[key]
+    if not isinstance(value, list):
+        raise UnsupportedConfig('{} is not a list'.format(key))
+
+    return value
+
+
+def get_dict(data, key):
+    if key not in data:
+        return {}
+
+    value = data[key]
+    if not isinstance(value, dict):
+        raise UnsupportedConfig('{} is not a mapping'.format(key))
+
+    return value
@@ -0,0 +1,158 @@
+import logging
+import select
+import threading
+import time
+import uuid
+
+import sqlalchemy as sa
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from skygear.options import options
+from skygear.utils import db
+
+from . import json_codec
+from .config_loader import RELOAD_SCHEMA
+from .config_loader import RELOAD_SOURCE
+from .settings import CMS_CONFIG_INVALIDATION_DEBOUNCE
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'skygear_cms_config_invalidation'
+
+# identifies this process, notifications sent by it are ignored
+INSTANCE_ID = uuid.uuid4().hex
+
+# reasons used when notifications might have been missed
+ALL_REASONS = [RELOAD_SCHEMA, RELOAD_SOURCE]
+
+POLL_INTERVAL = 5  # in seconds
+RECONNECT_INTERVAL = 5  # in seconds
+
+
+def publish_invalidation(reasons):
+    """
+    Tell the other plugin processes of this app to reload their config.
+    """
+    payload = json_codec.dumps_bytes({
+        'app': options.appname,
+        'instance': INSTANCE_ID,
+        'reasons': sorted(reasons),
+    }).decode('utf-8')
+    try:
+        with db.conn() as conn:
+            conn.execute(
+                sa.text('SELECT pg_notify(:channel, :payload)'),
+                channel=CHANNEL,
+                payload=payload)
+    except Exception:
+        logger.exception('Failed to publish cms config invalidation')
+
+
+def parse_invalidation(payload):
+    """
+    Return the reasons of an invalidation sent by another process of this
+    app, None otherwise.
+    """
+    try:
+        message = json_codec.loads(payload)
+    except ValueError:
+        return None
+
+    if not isinstance(message, dict) or \
+       message.get('app') != options.appname or \
+       message.get('instance') == INSTANCE_ID:
+        return None
+
+    reasons = message.get('reasons')
+    if not isinstance(reasons, list):
+        return None
+
+    return set(reasons)
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Listen for invalidations published by other processes.
+
+    Invalidations received within `debounce` seconds of the first one are
+    merged, and on_invalidate is called once with all their reasons.
+    """
+
+    def __init__(self,
+                 on_invalidate,
+                 debounce=CMS_CONFIG_INVALIDATION_DEBOUNCE):
+        super(InvalidationListener, self).__init__(
+            name='cms-config-invalidation', daemon=True)
+        self.on_invalidate = on_invalidate
+        self.debounce = debounce
+        self.stopped = threading.Event()
+
+        self._reasons = set()
+        self._due_at = None
+        self._has_listened = False
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('Lost cms config invalidation listener')
+                self.stopped.wait(RECONNECT_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+
+    def listen(self):
+        connection = db._get_engine().raw_connection()
+        # the connection is left in autocommit mode, keep it out of the pool
+        connection.detach()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute('LISTEN {}'.format(CHANNEL))
+
+            if self._has_listened:
+                # notifications sent while reconnecting are lost
+                self.invalidate(ALL_REASONS)
+            self._has_listened = True
+
+            while not self.stopped.is_set():
+                readable, _, _ = select.select([dbapi_connection], [], [],
+                                               self._poll_timeout())
+                if readable:
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        self.receive(notify.payload)
+
+                self.flush()
+        finally:
+            connection.close()
+
+    def receive(self, payload):
+        reasons = parse_invalidation(payload)
+        if reasons:
+            self.invalidate(reasons)
+
+    def invalidate(self, reasons):
+        self._reasons.update(reasons)
+        if self._due_at is None:
+            self._due_at = time.monotonic() + self.debounce
+
+    def flush(self):
+        if self._due_at is None or time.monotonic() < self._due_at:
+            return
+
+        reasons = self._reasons
+        self._reasons = set()
+        self._due_at = None
+        try:
+            self.on_invalidate(reasons)
+        except Exception:
+            logger.exception('Failed to invalidate cms config')
+
+    def _poll_timeout(self):
+        if self._due_at is None:
+            return POLL_INTERVAL
+
+        return max(self._due_at - time.monotonic(), 0)
@@ -1,93 +1,525 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
 import urllib.parse as urlparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from datetime import datetime
+from io import BytesIO
 from urllib.parse import urlencode
 
 import requests
 from ruamel.yaml import YAML
 
+from . import deadline
+from . import json_codec
+from .compression import gzip_data
+from .config_builder import ConfigBuilder
+from .config_builder import build_config
 from .generate_config import generate_config
+from .models.cms_config import CMSConfig
 from .models.cms_config import CMSRecord
 from .schema.cms_config import CMSAssociationRecordSchema
 from .schema.cms_config import CMSConfigSchema
 from .schema.skygear_schema import SkygearSchemaSchema
+from .settings import CMS_CLIENT_CONFIG_JSON
 from .settings import CMS_CONFIG_FILE_URL
+from .settings import CMS_CONFIG_PARSER
+from .settings import CMS_CONFIG_REFRESH_INTERVAL
+from .settings import CMS_CONFIG_SNAPSHOT_PATH
 from .settings import CMS_SKYGEAR_ENDPOINT
+from .settings import CMS_UPSTREAM_CONNECT_TIMEOUT
+from .settings import CMS_UPSTREAM_READ_TIMEOUT
+from .skygear_async_utils import call_with_deadline
 from .skygear_utils import get_schema
 
+logger = logging.getLogger(__name__)
+
 cms_config_loader = None
+cms_config_loader_lock = threading.Lock()
+
+# downloads the schema while the config file is fetched
+schema_executor = ThreadPoolExecutor(max_workers=1)
+
+# functions called with each loaded CMSConfig, to compile what is derived
+# from it, see register_config_compiler
+config_compilers = []
+
+FILE_SCHEME = 'file'
+
+# bump when the pickled models change
+SNAPSHOT_VERSION = 3
+
+# config parsers, the fast parser falls back to the schemas on errors
+CONFIG_PARSER_FAST = 'fast'
+CONFIG_PARSER_SCHEMA = 'schema'
+
+# reasons to reload
+RELOAD_SOURCE = 'source'
+RELOAD_SCHEMA = 'schema'
+
+# A loaded config. It is replaced as a whole and never modified.
+ConfigState = namedtuple('ConfigState', [
+    'config_source',
+    'config_bytes',
+    'etag',
+    'last_modified',
+    'mtime',
+    'schema',
+    'schema_digest',
+    'config',
+    'default_config',
+    'config_json',
+])
 
 
 class ConfigLoader:
-    def __init__(self):
+    """
+    Load the cms config from config_source, or generate the default config
+    from the skygear schema if there is no config source.
+
+    http(s) sources are revalidated with conditional requests, file sources
+    are read again when modified. The config is parsed again only if the
+    content changed. If only the schema changed, only the imports and
+    exports of the changed record types are parsed again.
+
+    With CMS_CONFIG_REFRESH_INTERVAL set, a background thread keeps the
+    config up to date, otherwise the source is revalidated after
+    set_config_source.
+
+    The loaded config is kept in an immutable ConfigState. A reload builds
+    a new state and swaps it in, one reload at a time. While a reload is
+    in progress, other threads keep using the current state.
+
+    With CMS_CONFIG_SNAPSHOT_PATH set, the state is saved to disk, and used
+    right after a restart while it is verified in the background.
+
+    The fast parser loads the YAML with the safe loader and builds the
+    config with ConfigBuilder. The schema parser uses the round-trip loader
+    and the marshmallow schemas. Both build the same config.
+    """
+
+    def __init__(self,
+                 snapshot_path=CMS_CONFIG_SNAPSHOT_PATH,
+                 parser=CMS_CONFIG_PARSER):
+        self.snapshot_path = snapshot_path
+        self.parser = parser
         self.config_source = None
-        self.config_data = None
-        self.schema = None
-        self.config = None
+        self.client_config_source = None
+        self.state = None
+        self.refresher = None
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_reasons = set()
 
     @classmethod
     def get_instance(cls):
         global cms_config_loader
         if cms_config_loader is None:
-            cms_config_loader = ConfigLoader()
-            cms_config_loader.set_config_source(CMS_CONFIG_FILE_URL)
+            with cms_config_loader_lock:
+                if cms_config_loader is None:
+                    config_loader = ConfigLoader()
+                    config_loader.set_config_source(CMS_CONFIG_FILE_URL)
+                    config_loader.load_snapshot()
+                    cms_config_loader = config_loader
 
         return cms_config_loader
 
     def set_config_source(self, config_source, add_random_string=True):
-        if add_random_string and config_source:
-            config_source = add_random_string_to_query_params(config_source)
+        """
+        Set the config source, the source is revalidated on next use.
 
-        self.config_source = config_source
-        self.config_data = None
-        self.config = None
+        The random string is added to the url for the CMS client only, so
+        that browsers do not use a cached config after a reload.
+        """
+        client_config_source = config_source
+        if add_random_string and config_source and \
+           not is_file_source(config_source):
+            client_config_source = \
+                add_random_string_to_query_params(config_source)
+
+        with self._lock:
+            self.config_source = config_source
+            self.client_config_source = client_config_source
+            self._reload_reasons.add(RELOAD_SOURCE)
 
     def get_config_source(self):
         """
         This is for external use only.
 
         ConfigLoader should generate default config itself if it finds
-        config_source is empty.
+        config_source is empty. File sources are served by the plugin.
+        With CMS_CLIENT_CONFIG_JSON set, the CMS client gets the config
+        from the plugin in JSON.
         """
-        default_source = CMS_SKYGEAR_ENDPOINT + 'default-cms-config.yaml'
-        return self.config_source or default_source
+        if CMS_CLIENT_CONFIG_JSON:
+            return CMS_SKYGEAR_ENDPOINT + 'config.json'
+
+        if not self.config_source:
+            return CMS_SKYGEAR_ENDPOINT + 'default-cms-config.yaml'
+
+        if is_file_source(self.config_source):
+            return CMS_SKYGEAR_ENDPOINT + 'cms-config.yaml'
+
+        return self.client_config_source
 
     def reset_schema(self):
-        self.schema = None
-        self.config = None
+        with self._lock:
+            self._reload_reasons.add(RELOAD_SCHEMA)
 
     def get_config(self):
-        config_source = self.config_source
-        if not config_source:
-            return self._get_default_config()
+        state = self.get_state()
+        if state.config_source:
+            return state.config
 
-        if self.config_data is None:
-            self.config_data = self._download_config_data(self.config_source)
+        return state.default_config.config
 
-        if self.schema is None:
-            self.schema = self._download_schema()
+    def get_state(self):
+        """
+        Return the current state, reloading it first if needed.
 
-        if self.config is None:
-            self.config = self._parse_config(self.schema, self.config_data)
+        If another thread is reloading, the current state is returned
+        without waiting, unless there is no state yet.
+        """
+        state = self.state
+        if state is not None and not self._needs_reload(state):
+            return state
 
-        return self.config
+        if state is None:
+            self._reload_lock.acquire()
+        elif not self._reload_lock.acquire(blocking=False):
+            return state
 
-    def _get_default_config(self):
-        schema = self._download_schema()
-        config_data = generate_config(schema)
-        return self._parse_config(schema, config_data)
+        try:
+            current = self.state
+            if current is not None and current is not state and \
+               not self._needs_reload(current):
+                # reloaded by another thread
+                return current
+
+            return self._reload()
+        except Exception:
+            if state is None:
+                raise
+
+            logger.exception('Failed to reload cms config')
+            return state
+        finally:
+            self._reload_lock.release()
+
+    def get_config_file(self):
+        """
+        Return the content of the config source and its ETag.
+        """
+        state = self.get_state()
+        return state.config_bytes, make_etag(state.config_bytes)
+
+    def get_default_config_file(self):
+        """
+        Return the default config in YAML and its ETag.
+        """
+        state = self.get_state()
+        if state.default_config is None:
+            with self._reload_lock:
+                state = self.state
+                if state.default_config is None:
+                    state = state._replace(
+                        default_config=DefaultConfig(state.schema,
+                                                     self._parse_config))
+                    self.state = state
+
+        default_config = state.default_config
+        return default_config.yaml_bytes, default_config.etag
+
+    def get_config_json(self):
+        """
+        Return the ConfigJSON of the config source, or of the default config
+        if there is no config source.
+        """
+        state = self.get_state()
+        if state.config_json is None:
+            with self._reload_lock:
+                state = self.state
+                if state.config_json is None:
+                    if state.config_source:
+                        yaml_bytes = state.config_bytes
+                    else:
+                        if state.default_config is None:
+                            state = state._replace(
+                                default_config=DefaultConfig(
+                                    state.schema, self._parse_config))
+                        yaml_bytes = state.default_config.yaml_bytes
+
+                    state = state._replace(config_json=ConfigJSON(yaml_bytes))
+                    self.state = state
+
+        return state.config_json
+
+    def reload(self, reasons=(RELOAD_SOURCE, )):
+        """
+        Reload the config, waiting for any reload in progress.
+        """
+        with self._lock:
+            self._reload_reasons.update(reasons)
+
+        with self._reload_lock:
+            return self._reload()
+
+    def start_refresher(self, interval=CMS_CONFIG_REFRESH_INTERVAL):
+        """
+        Refresh the config in a background thread every interval seconds,
+        so that get_config does not wait for the config source.
+        """
+        if self.refresher is not None or not interval:
+            return
+
+        self.refresher = ConfigRefresher(self, interval)
+        self.refresher.start()
+
+    def refresh(self):
+        """
+        Refresh and parse the config ahead of use.
+        """
+        self.reload()
+
+    def revalidate(self):
+        """
+        Fetch the config source and the schema, and parse the config again
+        if either of them changed, e.g. after loading a snapshot.
+        """
+        self.reload(reasons=(RELOAD_SOURCE, RELOAD_SCHEMA))
+
+    def start_revalidation(self):
+        thread = threading.Thread(
+            target=log_exception(self.revalidate,
+                                 'Failed to revalidate cms config'),
+            name='cms-config-revalidation',
+            daemon=True)
+        thread.start()
+        return thread
+
+    def load_snapshot(self):
+        """
+        Restore the state saved by save_snapshot, if it was saved for the
+        same config source.
+
+        Return True if the snapshot is loaded.
+        """
+        if not self.snapshot_path:
+            return False
+
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.warning('Failed to load cms config snapshot', exc_info=True)
+            return False
+
+        if snapshot.get('version') != SNAPSHOT_VERSION or \
+           snapshot.get('config_source') != self.config_source or \
+           snapshot.get('key') != snapshot_key(snapshot['config_bytes'],
+                                               snapshot['schema_digest']):
+            return False
+
+        with self._lock:
+            self.state = ConfigState(
+                config_source=snapshot['config_source'],
+                config_bytes=snapshot['config_bytes'],
+                etag=snapshot['etag'],
+                last_modified=snapshot['last_modified'],
+                mtime=snapshot['mtime'],
+                schema=snapshot['schema'],
+                schema_digest=snapshot['schema_digest'],
+                config=snapshot['config'],
+                default_config=snapshot['default_config'],
+                config_json=None,
+            )
+            if self.state.config is not None:
+                self._compile_config(self.state.config)
+            if self.state.default_config is not None:
+                self._compile_config(self.state.default_config.config)
+            self._reload_reasons.clear()
+
+        return True
+
+    def save_snapshot(self, state):
+        if not self.snapshot_path:
+            return
+
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'config_source': state.config_source,
+            'key': snapshot_key(state.config_bytes, state.schema_digest),
+            'config_bytes': state.config_bytes,
+            'etag': state.etag,
+            'last_modified': state.last_modified,
+            'mtime': state.mtime,
+            'schema': state.schema,
+            'schema_digest': state.schema_digest,
+            'config': state.config,
+            'default_config': state.default_config,
+        }
+        try:
+            write_file_atomically(self.snapshot_path,
+                                  pickle.dumps(snapshot, protocol=4))
+        except Exception:
+            logger.warning('Failed to save cms config snapshot', exc_info=True)
+
+    def _needs_reload(self, state):
+        if self._reload_reasons or state.config_source != self.config_source:
+            return True
+
+        if self.refresher is None and is_file_source(state.config_source):
+            path = file_source_path(state.config_source)
+            try:
+                return os.stat(path).st_mtime_ns != state.mtime
+            except OSError:
+                return True
+
+        return False
+
+    def _reload(self):
+        """
+        Build a new state and swap it in. Must be called with _reload_lock.
+        """
+        with self._lock:
+            reasons = self._reload_reasons
+            self._reload_reasons = set()
+            config_source = self.config_source
+
+        try:
+            state = self._build_state(self.state, config_source, reasons)
+        except Exception:
+            with self._lock:
+                self._reload_reasons.update(reasons)
+            raise
+
+        if state is not self.state:
+            self.state = state
+            self.save_snapshot(state)
+
+        return state
+
+    def _build_state(self, old_state, config_source, reasons):
+        """
+        Return a new state, or old_state if nothing changed.
+        """
+        is_same_source = old_state is not None and \
+            old_state.config_source == config_source
+        if not is_same_source:
+            old_state = None
+
+        config_file = ConfigFile()
+        if old_state is not None:
+            config_file = ConfigFile(old_state.config_bytes, old_state.etag,
+                                     old_state.last_modified, old_state.mtime)
+        schema_future = None
+        if old_state is None or RELOAD_SCHEMA in reasons:
+            schema_future = schema_executor.submit(call_with_deadline,
+                                                   deadline.current(),
+                                                   self._download_schema)
+
+        if config_source:
+            config_file = fetch_config_file(config_source, config_file)
+
+        if schema_future is not None:
+            schema, schema_digest = schema_future.result()
+        else:
+            schema, schema_digest = old_state.schema, old_state.schema_digest
+
+        if old_state is not None and \
+           old_state.config_bytes == config_file.content and \
+           old_state.schema_digest == schema_digest:
+            if old_state.etag == config_file.etag and \
+               old_state.last_modified == config_file.last_modified and \
+               old_state.mtime == config_file.mtime:
+                return old_state
+
+            return old_state._replace(
+                etag=config_file.etag,
+                last_modified=config_file.last_modified,
+                mtime=config_file.mtime)
 
-    def _download_config_data(self, file_path):
-        r = requests.get(file_path)
-        if not (200 <= r.status_code <= 299):
-            raise Exception('Failed to get cms config yaml file')
+        config = None
+        default_config = None
+        if config_source:
+            config_data = self._load_config_data(config_file.content)
+            if old_state is not None and \
+               old_state.config_bytes == config_file.content:
+                # only the schema changed
+                config = self._reparse_config(
+                    old_state.config, schema, config_data,
+                    old_state.schema.changed_record_types(schema))
+            else:
+                config = self._parse_config(schema, config_data)
+        else:
+            default_config = DefaultConfig(schema, self._parse_config)
 
-        yaml = YAML()
-        return yaml.load(r.text)
+        return ConfigState(
+            config_source=config_source,
+            config_bytes=config_file.content,
+            etag=config_file.etag,
+            last_modified=config_file.last_modified,
+            mtime=config_file.mtime,
+            schema=schema,
+            schema_digest=schema_digest,
+            config=config,
+            default_config=default_config,
+            config_json=None,
+        )
 
     def _download_schema(self):
-        return SkygearSchemaSchema().load(get_schema())
+        """
+        Return the schema and a digest of it.
+        """
+        raw_schema = get_schema()
+        schema_digest = hashlib.sha256(
+            json_codec.dumps_bytes(raw_schema, sort_keys=True)).hexdigest()
+        return SkygearSchemaSchema().load(raw_schema), schema_digest
+
+    def parse_config_file(self, schema, content):
+        """
+        Parse the content of a config file.
+        """
+        return self._parse_config(schema, self._load_config_data(content))
+
+    def _load_config_data(self, content):
+        if self.parser == CONFIG_PARSER_FAST:
+            # uses the C parser when available
+            return YAML(typ='safe').load(content)
+
+        return YAML().load(content)
 
     def _parse_config(self, schema, config_data):
+        return self._compile_config(
+            self._parse_config_data(schema, config_data))
+
+    def _compile_config(self, config):
+        for compiler in config_compilers:
+            try:
+                compiler(config)
+            except Exception:
+                logger.exception('Failed to compile cms config')
+
+        return config
+
+    def _parse_config_data(self, schema, config_data):
+        if self.parser == CONFIG_PARSER_FAST:
+            try:
+                return build_config(schema, config_data)
+            except Exception:
+                # the schemas report the error
+                logger.warning(
+                    'Failed to build cms config, parsing with schemas',
+                    exc_info=True)
+
         association_records_data = config_data['association_records'] \
                                    if 'association_records' in config_data \
                                    else {}
@@ -108,17 +540,267 @@ class ConfigLoader:
             }
             association_records[key] = association_record_schema.load(value)
 
+        cms_config = self._load_entries(schema, cms_records,
+                                        association_records, config_data)
+        cms_config.association_records = association_records
+        cms_config.cms_records = cms_records
+        return cms_config
+
+    def _reparse_config(self, config, schema, config_data,
+                        changed_record_types):
+        """
+        Parse the config data again for a changed schema.
+
+        config is parsed from the same config data with the old schema.
+        Only the imports and exports depending on the changed record types
+        are parsed again, the others are reused. Records and association
+        records do not depend on the schema and are always reused.
+        """
+        imports_data = \
+            config_data['imports'] if 'imports' in config_data else {}
+        exports_data = \
+            config_data['exports'] if 'exports' in config_data else {}
+
+        def is_affected(parsed, name):
+            return name not in parsed or \
+                not parsed[name].get_record_types().isdisjoint(
+                    changed_record_types)
+
+        affected_data = {
+            'imports': {
+                k: v
+                for k, v in imports_data.items()
+                if is_affected(config.imports, k)
+            },
+            'exports': {
+                k: v
+                for k, v in exports_data.items()
+                if is_affected(config.exports, k)
+            },
+        }
+
+        affected_config = self._parse_entries(schema, config.cms_records,
+                                              config.association_records,
+                                              affected_data)
+
+        logger.info('Parsed %d of %d imports and %d of %d exports again',
+                    len(affected_config.imports), len(imports_data),
+                    len(affected_config.exports), len(exports_data))
+
+        imports = {
+            k: affected_config.imports.get(k) or config.imports[k]
+            for k in imports_data
+        }
+        exports = {
+            k: affected_config.exports.get(k) or config.exports[k]
+            for k in exports_data
+        }
+        return self._compile_config(
+            CMSConfig(
+                imports=imports,
+                exports=exports,
+                cms_records=config.cms_records,
+                association_records=config.association_records))
+
+    def _parse_entries(self, schema, cms_records, association_records,
+                       config_data):
+        """
+        Parse the imports and exports of config_data with the given records
+        and association records.
+        """
+        if self.parser == CONFIG_PARSER_FAST:
+            builder = ConfigBuilder(schema, cms_records, association_records)
+            try:
+                return builder.build_config(config_data)
+            except Exception:
+                # the schemas report the error
+                logger.warning(
+                    'Failed to build cms config, parsing with schemas',
+                    exc_info=True)
+
+        return self._load_entries(schema, cms_records, association_records,
+                                  config_data)
+
+    def _load_entries(self, schema, cms_records, association_records,
+                      config_data):
         config_schema = CMSConfigSchema()
         config_schema.context = {
             'schema': schema,
             'association_records': association_records,
             'cms_records': cms_records,
         }
+        return config_schema.load(config_data)
 
-        cms_config = config_schema.load(config_data)
-        cms_config.association_records = association_records
-        cms_config.cms_records = cms_records
-        return cms_config
+
+def register_config_compiler(compiler):
+    """
+    Call compiler with each CMSConfig loaded from now on, e.g. to compile
+    the plans of the exports ahead of requests. Compilers must not modify
+    the config.
+    """
+    config_compilers.append(compiler)
+
+
+ConfigFile = namedtuple('ConfigFile',
+                        ['content', 'etag', 'last_modified', 'mtime'])
+ConfigFile.__new__.__defaults__ = (None, None, None, None)
+
+
+def fetch_config_file(config_source, config_file):
+    """
+    Return the config file of the source. The given config_file is
+    returned if the source has not changed since it was fetched.
+    """
+    if is_file_source(config_source):
+        return read_config_file(config_source, config_file)
+
+    return download_config_file(config_source, config_file)
+
+
+def read_config_file(config_source, config_file):
+    path = file_source_path(config_source)
+    mtime = os.stat(path).st_mtime_ns
+    if config_file.content is not None and mtime == config_file.mtime:
+        return config_file
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    return ConfigFile(content=content, mtime=mtime)
+
+
+def download_config_file(config_source, config_file):
+    headers = {}
+    if config_file.content is not None:
+        if config_file.etag:
+            headers['If-None-Match'] = config_file.etag
+        if config_file.last_modified:
+            headers['If-Modified-Since'] = config_file.last_modified
+
+    timeout = (CMS_UPSTREAM_CONNECT_TIMEOUT, CMS_UPSTREAM_READ_TIMEOUT)
+    r = requests.get(
+        config_source, headers=headers, timeout=deadline.clip_timeout(timeout))
+    if r.status_code == 304 and config_file.content is not None:
+        return config_file
+
+    if not (200 <= r.status_code <= 299):
+        raise Exception('Failed to get cms config yaml file')
+
+    return ConfigFile(
+        content=r.content,
+        etag=r.headers.get('ETag'),
+        last_modified=r.headers.get('Last-Modified'))
+
+
+class DefaultConfig:
+    """
+    The config generated from a schema, in YAML and parsed.
+    """
+
+    def __init__(self, schema, parse_config):
+        config_data = generate_config(schema)
+
+        # render before parsing, parsing modifies config_data
+        stream = BytesIO()
+        YAML().dump(config_data, stream)
+        self.yaml_bytes = stream.getvalue()
+        self.etag = make_etag(self.yaml_bytes)
+        self.config = parse_config(schema, config_data)
+
+
+class ConfigJSON:
+    """
+    A config file in compact JSON, as is and gzipped, for the CMS client.
+    """
+
+    def __init__(self, yaml_bytes):
+        config_data = YAML(typ='safe').load(yaml_bytes)
+        self.json_bytes = json_codec.dumps_bytes(to_json_data(config_data))
+        self.gzip_bytes = gzip_data(self.json_bytes)
+        self.etag = make_etag(self.json_bytes)
+
+
+def to_json_data(value):
+    """
+    Convert the YAML timestamps in loaded config data to ISO 8601 strings.
+    """
+    if isinstance(value, dict):
+        return {k: to_json_data(v) for k, v in value.items()}
+
+    if isinstance(value, list):
+        return [to_json_data(v) for v in value]
+
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+
+    return value
+
+
+class ConfigRefresher(threading.Thread):
+    def __init__(self, config_loader, interval):
+        super(ConfigRefresher, self).__init__(
+            name='cms-config-refresher', daemon=True)
+        self.config_loader = config_loader
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.config_loader.refresh()
+            except Exception:
+                logger.exception('Failed to refresh cms config')
+
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def is_file_source(config_source):
+    return urlparse.urlparse(config_source or '').scheme == FILE_SCHEME
+
+
+def file_source_path(config_source):
+    return urlparse.unquote(urlparse.urlparse(config_source).path)
+
+
+def make_etag(data):
+    """
+    A strong ETag, without quotes, of the content.
+    """
+    if data is None:
+        return None
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def snapshot_key(config_bytes, schema_digest):
+    digest = hashlib.sha256(config_bytes or b'')
+    digest.update(schema_digest.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_file_atomically(path, data):
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+def log_exception(fn, message):
+    def wrapped():
+        try:
+            fn()
+        except Exception:
+            logger.exception(message)
+
+    return wrapped
 
 
 def add_random_string_to_query_params(url):
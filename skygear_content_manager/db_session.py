@@ -1,9 +1,12 @@
+import time
 from contextlib import contextmanager
 
 from skygear.options import options
 from skygear.utils.db import _get_engine
 from sqlalchemy.orm import sessionmaker
 
+from . import metrics
+
 Session = sessionmaker()
 
 
@@ -11,6 +14,7 @@ Session = sessionmaker()
 def scoped_session(session=None):
     if session is None:
         session = _create_session()
+    start = time.perf_counter()
     try:
         session.execute('SET search_path TO app_%s, public' % options.appname)
         yield session
@@ -20,6 +24,7 @@ def scoped_session(session=None):
         raise
     finally:
         session.close()
+        metrics.db_session_seconds.observe(time.perf_counter() - start)
 
 
 def _create_session(isolation_level=None):
@@ -0,0 +1,78 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def current():
+    """
+    The monotonic time by which the current request has to complete, None
+    if there is no deadline.
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def remaining():
+    """
+    Seconds left before the current deadline, None if there is no deadline.
+    """
+    deadline = current()
+    if deadline is None:
+        return None
+
+    return deadline - time.monotonic()
+
+
+def check():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Set a deadline for the calls made in this block.
+
+    A nested deadline cannot extend the enclosing one.
+    """
+    with deadline_at(time.monotonic() + seconds):
+        yield
+
+
+@contextmanager
+def deadline_at(at):
+    """
+    Set an absolute deadline, e.g. one passed from another thread.
+    """
+    previous = current()
+    if at is not None and (previous is None or at < previous):
+        _local.deadline = at
+
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def clip_timeout(timeout):
+    """
+    Limit a requests timeout, a number or a (connect, read) tuple, to the
+    time left before the deadline.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+
+    if left <= 0:
+        raise DeadlineExceeded()
+
+    if isinstance(timeout, tuple):
+        return tuple(min(t, left) for t in timeout)
+
+    return min(timeout, left)
@@ -1,6 +1,3 @@
-import copy
-
-
 def generate_config(schema):
     return {
         'site': generate_site_config(schema),
@@ -13,7 +10,7 @@ def generate_site_config(schema):
         'type': 'user_management',
     }]
 
-    if has_asset_field(schema):
+    if schema.has_asset_field:
         non_record_pages = non_record_pages + [{
             'type': 'file_import',
         }]
@@ -36,14 +33,22 @@ def generate_records_config(schema):
 def generate_record_config(record):
     fields_config = generate_fields_config(record)
     return {
-        # deep copy the config to avoid references in generated yaml
-        'list': copy.deepcopy(fields_config),
-        'show': copy.deepcopy(fields_config),
-        'edit': copy.deepcopy(fields_config),
-        'new': copy.deepcopy(fields_config),
+        # copy the config to avoid references in generated yaml
+        'list': copy_fields_config(fields_config),
+        'show': copy_fields_config(fields_config),
+        'edit': copy_fields_config(fields_config),
+        'new': copy_fields_config(fields_config),
     }
 
 
+def copy_fields_config(fields_config):
+    """
+    Copy the config generated by generate_fields_config, where each field
+    config is a flat dict.
+    """
+    return {'fields': [dict(f) for f in fields_config['fields']]}
+
+
 def generate_fields_config(record):
     field_configs = []
     for field in record.fields:
@@ -97,13 +102,3 @@ def generate_field_config(record, field):
         return None
 
     return field_config
-
-
-def has_asset_field(schema):
-    for record_type in schema.record_types:
-        record = schema.record_types[record_type]
-        for field in record.fields:
-            if field.type == 'asset':
-                return True
-
-    return False
@@ -1,24 +1,46 @@
-import json
 import re
+import threading
+import weakref
 
 import arrow
 import strict_rfc3339
 
+from .. import json_codec
+
+# compiled record deserializers, by import config
+compiled_record_deserializers = weakref.WeakKeyDictionary()
+compiled_record_deserializers_lock = threading.Lock()
+
+
+def get_record_deserializer(import_config):
+    """
+    Return the RecordDeserializer of the import config, it is compiled once
+    per import config.
+    """
+    with compiled_record_deserializers_lock:
+        deserializer = compiled_record_deserializers.get(import_config)
+
+    if deserializer is None:
+        deserializer = RecordDeserializer(import_config.fields)
+        with compiled_record_deserializers_lock:
+            compiled_record_deserializers[import_config] = deserializer
+
+    return deserializer
+
 
 class RecordDeserializer:
 
     # field_configs: []CMSRecordImportField
     def __init__(self, field_configs):
         self.field_configs = field_configs
+        self.field_deserializers = [(field_config.name,
+                                     FieldDeserializer(field_config))
+                                    for field_config in field_configs]
 
     def deserialize(self, data):
         result = {}
-        for field_config in self.field_configs:
-            key = field_config.name
-            value = data.get(key)
-
-            deserializer = FieldDeserializer(field_config)
-            result[key] = deserializer.deserialize(value)
+        for key, deserializer in self.field_deserializers:
+            result[key] = deserializer.deserialize(data.get(key))
 
         return result
 
@@ -26,9 +48,10 @@ class RecordDeserializer:
 class FieldDeserializer:
     def __init__(self, field_config):
         self.field_config = field_config
+        self.value_deserializer = self.get_deserializer()
 
     def deserialize(self, value):
-        deserializer = self.get_deserializer()
+        deserializer = self.value_deserializer
 
         if not deserializer:
             field_name = self.field_config.name \
@@ -130,7 +153,7 @@ class JSONDeserializer(BaseValueDeserializer):
         if value == '':
             return None
 
-        return json.loads(value)
+        return json_codec.loads(value)
 
 
 class LocationDeserializer(BaseValueDeserializer):
@@ -1,8 +1,33 @@
-import json
-
 import arrow
 
+from .. import json_codec
 from ..models.cms_config import DISPLAY_MODE_GROUPED
+from ..models.cms_config import DISPLAY_MODE_SPREAD
+
+
+def compile_field_serializers(field_configs):
+    """
+    Create the field serializers that do not depend on the data, i.e. all
+    but the serializers of spread many-reference fields, which are None.
+    """
+    return [
+        None if is_spread_many_reference(field_config) else FieldSerializer(
+            field_config, get_field_count(field_config), 1)
+        for field_config in field_configs
+    ]
+
+
+def is_spread_many_reference(field_config):
+    return field_config.reference is not None and \
+        field_config.reference.is_many and \
+        field_config.reference.display_mode == DISPLAY_MODE_SPREAD
+
+
+def get_field_count(field_config):
+    if not field_config.reference:
+        return 1
+
+    return len(field_config.reference.target_fields)
 
 
 # TODO (Steven-Chan):
@@ -15,31 +40,44 @@ class RecordSerializer:
     """
 
     # field_configs: []CMSRecordExportField
-    def __init__(self, field_configs):
+    # field_serializers: compiled by compile_field_serializers
+    def __init__(self, field_configs, field_serializers=None):
+        if field_serializers is None:
+            field_serializers = compile_field_serializers(field_configs)
+
         self.field_configs = field_configs
+        self.field_serializers = field_serializers
+        self.record_counts = [1] * len(field_configs)
+
+    @property
+    def needs_walk_through(self):
+        """
+        Whether the serialization depends on the data walked through, i.e.
+        there are spread many-reference fields.
+        """
+        return None in self.field_serializers
 
     def walk_through(self, csv_datas):
         """
         Scan through all data to get necessary information for serialization
         e.g. number of transient reference data for reference data padding
-        """
-        self.serializers = [None] * len(self.field_configs)
-        field_counts = [1] * len(self.field_configs)
-        record_counts = [1] * len(self.field_configs)
 
-        for data in csv_datas:
-            for i in range(0, len(self.field_configs)):
-                field_config = self.field_configs[i]
-                if not field_config.reference:
-                    continue
+        The data can be walked through in batches, e.g. page by page, the
+        serializers then fit the data of all batches.
+        """
+        self.serializers = list(self.field_serializers)
+        for i in range(0, len(self.field_configs)):
+            if self.serializers[i] is not None:
+                continue
 
-                field_counts[i] = len(field_config.reference.target_fields)
-                if field_config.reference.is_many:
-                    record_counts[i] = max(len(data[i]), record_counts[i])
+            record_count = self.record_counts[i]
+            for data in csv_datas:
+                record_count = max(len(data[i]), record_count)
 
-        for i in range(0, len(self.field_configs)):
+            field_config = self.field_configs[i]
+            self.record_counts[i] = record_count
             self.serializers[i] = FieldSerializer(
-                self.field_configs[i], field_counts[i], record_counts[i])
+                field_config, get_field_count(field_config), record_count)
 
     def serialize(self, csv_data):
         result = []
@@ -264,7 +302,7 @@ class BooleanSerializer(BaseValueSerializer):
 
 class JSONSerializer(BaseValueSerializer):
     def serialize(self, value):
-        return json.dumps(value)
+        return json_codec.dumps(value)
 
 
 class LocationSerializer(BaseValueSerializer):
@@ -1,42 +1,43 @@
 import csv
+import io
+import tempfile
 
-from ..models.cms_config import DISPLAY_MODE_GROUPED
+from .. import json_codec
+from ..settings import CMS_EXPORT_SPILL_MEMORY
 from ..werkzeug_utils import prepare_file_response
 from .csv_serializer import SpreadListSerializer
 
+# size of the chunks of a generated CSV, in characters
+CHUNK_SIZE = 64 * 1024
 
-def render_header(stream, export_config, record_serializer):
+
+def render_header(stream, columns, record_serializer):
+    """
+    Write the header of the columns of an export plan.
+    """
     writer = csv.writer(stream)
     field_serializers = record_serializer.serializers
 
     # header
     column_names = []
-    for i in range(0, len(export_config.fields)):
-        field = export_config.fields[i]
-        if not field.reference or \
-           field.reference.display_mode == DISPLAY_MODE_GROUPED:
-            column_names.append(field.label)
-            continue
-
-        if not field.reference.is_many:
-            column_names = column_names + [
-                ref_field.label for ref_field in field.reference.target_fields
-            ]
+    for i in range(0, len(columns)):
+        column = columns[i]
+        if not column.spread:
+            column_names = column_names + list(column.labels)
             continue
 
         # handle many records with many fields
         serializer = field_serializers[i].value_serializer
         if not isinstance(serializer, SpreadListSerializer):
             raise Exception('Unexpected serializer for field {}'.format(
-                field.name))
+                column.name))
 
         for j in range(0, serializer.record_count):
             context = {
                 'index': j,
             }
             column_names = column_names + [
-                ref_field.label.format(**context)
-                for ref_field in field.reference.target_fields
+                label.format(**context) for label in column.labels
             ]
 
     writer.writerow(column_names)
@@ -48,5 +49,76 @@ def render_data(stream, csv_datas):
         writer.writerow(data)
 
 
-def prepare_response(name):
-    return prepare_file_response(name + '.csv', 'text/csv')
+def generate_csv(columns, record_serializer, pages):
+    """
+    Generate the CSV of pages of csv data, as chunks of bytes.
+
+    Widths of spread columns are only known after all data is walked
+    through. For such exports, the csv data is spilled to a temporary file
+    in a first pass, and serialized from the file in a second pass.
+    Otherwise rows are written as the pages come in.
+    """
+    stream = io.StringIO()
+    if not record_serializer.needs_walk_through:
+        record_serializer.walk_through([])
+        render_header(stream, columns, record_serializer)
+        for csv_datas in pages:
+            render_data(stream,
+                        [record_serializer.serialize(d) for d in csv_datas])
+            if stream.tell() >= CHUNK_SIZE:
+                yield pop_chunk(stream)
+
+        if stream.tell():
+            yield pop_chunk(stream)
+        return
+
+    with tempfile.SpooledTemporaryFile(
+            max_size=CMS_EXPORT_SPILL_MEMORY) as spill:
+        record_serializer.walk_through([])
+        for csv_datas in pages:
+            record_serializer.walk_through(csv_datas)
+            for data in csv_datas:
+                spill.write(json_codec.dumps_bytes(data) + b'\n')
+
+        render_header(stream, columns, record_serializer)
+        spill.seek(0)
+        writer = csv.writer(stream)
+        for line in spill:
+            data = json_codec.loads(line)
+            writer.writerow(record_serializer.serialize(data))
+            if stream.tell() >= CHUNK_SIZE:
+                yield pop_chunk(stream)
+
+        if stream.tell():
+            yield pop_chunk(stream)
+
+
+def pop_chunk(stream):
+    chunk = stream.getvalue().encode('utf-8')
+    stream.seek(0)
+    stream.truncate()
+    return chunk
+
+
+def prime_chunks(chunks):
+    """
+    Run an iterator of chunks until its first chunk, so that errors raised
+    before anything is written are raised here, and can still be responded
+    with an error status. Return an iterable of all the chunks.
+    """
+    first_chunk = next(chunks)
+
+    def resume():
+        try:
+            yield first_chunk
+            yield from chunks
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    return resume()
+
+
+def prepare_response(name, chunks=None):
+    return prepare_file_response(name + '.csv', 'text/csv', chunks)
@@ -0,0 +1,85 @@
+import logging
+import threading
+import weakref
+from collections import namedtuple
+
+from ..models.cms_config import DISPLAY_MODE_GROUPED
+from ..record_utils import get_foreign_lookups
+from .csv_serializer import compile_field_serializers
+
+logger = logging.getLogger(__name__)
+
+# How an export is carried out, compiled once per export config.
+#
+# includes: keypaths of direct references, included in the query
+# lookups: ForeignLookup of the many-reference fields
+# fields: the export fields, in column order
+# columns: Column of each field
+# field_serializers: compiled by compile_field_serializers
+ExportPlan = namedtuple('ExportPlan', [
+    'record_type',
+    'includes',
+    'lookups',
+    'fields',
+    'columns',
+    'field_serializers',
+])
+
+# The header labels of a field. Labels of spread many-reference fields are
+# repeated for each foreign record, with {index} replaced by the index.
+Column = namedtuple('Column', ['name', 'labels', 'spread'])
+
+# export plans, by export config
+export_plans = weakref.WeakKeyDictionary()
+export_plans_lock = threading.Lock()
+
+
+def get_export_plan(export_config):
+    """
+    Return the plan of the export config, compiling it if it is not
+    compiled yet.
+    """
+    with export_plans_lock:
+        plan = export_plans.get(export_config)
+
+    if plan is None:
+        plan = compile_export_plan(export_config)
+        with export_plans_lock:
+            export_plans[export_config] = plan
+
+    return plan
+
+
+def compile_export_plans(config):
+    """
+    Compile the plans of all exports of a CMSConfig. Exports failing to
+    compile are logged, and fail again when they are requested.
+    """
+    for name, export_config in config.exports.items():
+        try:
+            get_export_plan(export_config)
+        except Exception:
+            logger.warning(
+                'Failed to compile export "%s"', name, exc_info=True)
+
+
+def compile_export_plan(export_config):
+    fields = tuple(export_config.fields)
+    return ExportPlan(
+        record_type=export_config.record_type,
+        includes=tuple(export_config.get_direct_reference_fields()),
+        lookups=get_foreign_lookups(export_config),
+        fields=fields,
+        columns=tuple(get_column(field) for field in fields),
+        field_serializers=tuple(compile_field_serializers(fields)),
+    )
+
+
+def get_column(field):
+    if not field.reference or \
+       field.reference.display_mode == DISPLAY_MODE_GROUPED:
+        return Column(name=field.name, labels=(field.label, ), spread=False)
+
+    labels = tuple(f.label for f in field.reference.target_fields)
+    return Column(
+        name=field.name, labels=labels, spread=field.reference.is_many)
@@ -7,9 +7,12 @@ from ..db_session import scoped_session
 from ..models.asset import Asset
 from ..models.cms_config import DUPLICATION_HANDLING_USE_FIRST
 from ..models.imported_file import CmsImportedFile
-from ..record_utils import fetch_records_by_values_in_key
+from ..record_utils import iter_records_by_values_in_key
+from ..skygear_async_utils import gather
+from ..skygear_async_utils import run_in_executor
+from ..skygear_async_utils import run_sync
 from ..skygear_utils import save_records
-from .csv_deserializer import RecordDeserializer
+from .csv_deserializer import get_record_deserializer
 
 
 class RecordIdentifierMap:
@@ -179,29 +182,14 @@ def prepare_import_records(stream, import_config, atomic):
         data = project_csv_data(row, column_mapping)
         data_list.append(data)
 
-    identifier_map = RecordIdentifierMap()
-    if import_config.identifier is not None and \
-       import_config.identifier != '_id':
-        identifier_map = create_identifier_map(
-            [r[import_config.identifier] for r in data_list],
-            import_config.record_type, import_config.identifier,
-            import_config.handle_duplicated_identifier)
-
-    reference_fields = import_config.get_reference_fields()
-    reference_identifier_maps = {}
-    for reference_field in reference_fields:
-        reference = reference_field.reference
-        m = create_identifier_map([r[reference_field.name] for r in data_list],
-                                  reference.target_cms_record.record_type,
-                                  reference.target_fields[0].name,
-                                  reference_field.handle_duplicated_reference)
-        reference_identifier_maps[reference_field.name] = m
+    identifier_map, reference_identifier_maps = run_sync(
+        create_identifier_maps_async(data_list, import_config))
 
     data_list = populate_record_reference(data_list, import_config,
                                           reference_identifier_maps)
     data_list = inject_asset(data_list, import_config)
 
-    deserializer = RecordDeserializer(import_config.fields)
+    deserializer = get_record_deserializer(import_config)
     records = deserialize_record_data(data_list, deserializer)
 
     # Since record deserialisation is based on import config
@@ -287,12 +275,58 @@ def project_csv_data(row, column_mapping):
     }
 
 
+async def create_identifier_maps_async(data_list, import_config):
+    """
+    Create the identifier map of the import record type and the identifier
+    maps of each reference field, concurrently.
+    """
+    reference_fields = import_config.get_reference_fields()
+    aws = []
+    for reference_field in reference_fields:
+        reference = reference_field.reference
+        values = [r[reference_field.name] for r in data_list]
+        aws.append(
+            create_identifier_map_async(
+                values, reference.target_cms_record.record_type,
+                reference.target_fields[0].name,
+                reference_field.handle_duplicated_reference))
+
+    has_identifier = import_config.identifier is not None and \
+        import_config.identifier != '_id'
+    if has_identifier:
+        aws.append(
+            create_identifier_map_async(
+                [r[import_config.identifier] for r in data_list],
+                import_config.record_type, import_config.identifier,
+                import_config.handle_duplicated_identifier))
+
+    maps = await gather(aws)
+
+    identifier_map = maps.pop() if has_identifier else RecordIdentifierMap()
+    reference_identifier_maps = {
+        reference_field.name: m
+        for reference_field, m in zip(reference_fields, maps)
+    }
+    return identifier_map, reference_identifier_maps
+
+
 def create_identifier_map(values, record_type, key, duplication_handling):
+    records = iter_records_by_values_in_key(record_type, key, values)
+    return build_identifier_map(records, record_type, key,
+                                duplication_handling)
+
+
+async def create_identifier_map_async(values, record_type, key,
+                                      duplication_handling):
+    return await run_in_executor(create_identifier_map, values, record_type,
+                                 key, duplication_handling)
+
+
+def build_identifier_map(records, record_type, key, duplication_handling):
     identifier_map = RecordIdentifierMap(
         allow_duplicate_value=duplication_handling ==
         DUPLICATION_HANDLING_USE_FIRST)
 
-    records = fetch_records_by_values_in_key(record_type, key, values)
     for record in records:
         identifier_map.set(
             record_type=record_type,
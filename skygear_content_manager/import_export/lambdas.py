@@ -1,19 +1,28 @@
-import json
 import os
 import tempfile
+import time
 from urllib.parse import parse_qs
 
 import skygear
 
+from .. import json_codec
+from .. import metrics
 from ..config_loader import ConfigLoader
-from ..record_utils import transient_foreign_records
+from ..config_loader import register_config_compiler
+from ..deadline import deadline
+from ..deadline import deadline_at
+from ..record_utils import transient_lookup_records_many
+from ..settings import CMS_EXPORT_PAGE_SIZE
+from ..settings import CMS_IMPORT_EXPORT_DEADLINE
 from ..skygear_utils import AuthData
 from ..skygear_utils import SkygearResponse
-from ..skygear_utils import fetch_records
+from ..skygear_utils import fetch_record_pages
 from .csv_serializer import RecordSerializer
+from .export_csv import generate_csv
 from .export_csv import prepare_response as prepare_export_response
-from .export_csv import render_data
-from .export_csv import render_header
+from .export_csv import prime_chunks
+from .export_plan import compile_export_plans
+from .export_plan import get_export_plan
 from .import_csv import FileSizeExceedLimitException
 from .import_csv import import_records
 from .import_csv import prepare_import_records
@@ -25,6 +34,8 @@ def register_lambdas(settings):
 
 
 def register_export_lambdas(settings):
+    register_config_compiler(compile_export_plans)
+
     @skygear.handler('cms-api/export')
     def export(request):
         data = parse_qs(request.query_string.decode())
@@ -46,34 +57,61 @@ def register_export_lambdas(settings):
         if not export_config:
             return skygear.Response('Export config not found', 404)
 
-        record_type = export_config.record_type
-        includes = export_config.get_direct_reference_fields()
+        plan = get_export_plan(export_config)
 
         predicate = None
         if predicate_string:
             try:
-                predicate = json.loads(predicate_string)
+                predicate = json_codec.loads(predicate_string)
             except Exception:
                 return skygear.Response('Invalid predicate', 400)
 
-        records = fetch_records(
-            record_type, includes=includes, predicate=predicate)
+        chunks = prime_chunks(generate_export(name, plan, predicate))
+        return prepare_export_response(name, chunks)
 
-        csv_datas = []
-        for record in records:
-            transient_foreign_records(record, export_config,
-                                      cms_config.association_records)
-            csv_data = record_to_csv_data(record, export_config.fields)
-            csv_datas.append(csv_data)
 
-        serializer = RecordSerializer(export_config.fields)
-        serializer.walk_through(csv_datas)
-        serialized_data = [serializer.serialize(d) for d in csv_datas]
+def generate_export(name, plan, predicate):
+    """
+    Generate the CSV of an export chunk by chunk, with the records fetched
+    page by page.
 
-        response = prepare_export_response(name)
-        render_header(response.stream, export_config, serializer)
-        render_data(response.stream, serialized_data)
-        return response
+    Only the plugin keeps one page in memory. The py-skygear transport
+    calls get_data() on the response and base64 encodes the body, so the
+    whole CSV is still buffered there before it is sent to skygear-server.
+    """
+    at = time.monotonic() + CMS_IMPORT_EXPORT_DEADLINE
+    rows = 0
+
+    def fetch_pages():
+        nonlocal rows
+        pages = fetch_record_pages(
+            plan.record_type,
+            includes=list(plan.includes),
+            predicate=predicate,
+            page_size=CMS_EXPORT_PAGE_SIZE,
+            prefetch=True)
+        while True:
+            with deadline_at(at):
+                records = next(pages, None)
+                if records is None:
+                    return
+
+                transient_lookup_records_many(records, plan.lookups)
+
+            rows = rows + len(records)
+            yield [
+                record_to_csv_data(record, plan.fields) for record in records
+            ]
+
+    size = 0
+    with metrics.export_seconds.time(name=name):
+        serializer = RecordSerializer(plan.fields, plan.field_serializers)
+        for chunk in generate_csv(plan.columns, serializer, fetch_pages()):
+            size = size + len(chunk)
+            yield chunk
+
+    metrics.export_rows.inc(rows, name=name)
+    metrics.export_bytes.inc(size, name=name)
 
 
 def register_import_lambdas(settings):
@@ -82,7 +120,7 @@ def register_import_lambdas(settings):
         files = request.files
         form = request.form
         key = form.get('key')
-        options = json.loads(form.get('options', '{}'))
+        options = json_codec.loads(form.get('options', '{}'))
 
         atomic = options.get('atomic', False)
 
@@ -108,15 +146,21 @@ def register_import_lambdas(settings):
         temp_file = tempfile.NamedTemporaryFile(suffix='.csv')
         file.save(temp_file.name)
 
+        file_size = os.stat(temp_file.name).st_size
         size_limit = import_config.limit.file_size
-        if size_limit and os.stat(temp_file.name).st_size > size_limit:
+        if size_limit and file_size > size_limit:
             raise FileSizeExceedLimitException(size_limit)
 
         records = None
-        with open(temp_file.name, 'r', encoding='utf-8') as fp:
-            records = prepare_import_records(fp, import_config, atomic)
+        with metrics.import_seconds.time(name=name), \
+                deadline(CMS_IMPORT_EXPORT_DEADLINE):
+            with open(temp_file.name, 'r', encoding='utf-8') as fp:
+                records = prepare_import_records(fp, import_config, atomic)
+
+            resp = import_records(records, atomic)
 
-        resp = import_records(records, atomic)
+        metrics.import_rows.inc(len(resp['result']), name=name)
+        metrics.import_bytes.inc(file_size, name=name)
         return resp
 
 
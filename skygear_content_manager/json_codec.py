@@ -0,0 +1,123 @@
+import json
+import math
+
+from .settings import CMS_JSON_CODEC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODEC_AUTO = 'auto'
+CODEC_ORJSON = 'orjson'
+CODEC_STDLIB = 'json'
+
+JSONDecodeError = json.JSONDecodeError
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+def get_codec_name(codec=CMS_JSON_CODEC):
+    if codec == CODEC_STDLIB or orjson is None:
+        return CODEC_STDLIB
+
+    return CODEC_ORJSON
+
+
+codec_name = get_codec_name()
+
+if orjson is not None:
+    # Types that orjson serializes natively but the json module does not
+    # are passed to the default function, which raises TypeError, so that
+    # they are handled, or rejected, by the json module.
+    ORJSON_DUMPS_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | \
+        orjson.OPT_PASSTHROUGH_DATACLASS | \
+        orjson.OPT_PASSTHROUGH_SUBCLASS
+
+
+def loads(data):
+    """
+    Decode JSON from str or bytes.
+
+    Documents that the fast codec rejects are decoded again by the json
+    module, so invalid JSON raises json.JSONDecodeError (a ValueError) as
+    json.loads does. orjson decodes integers over 64 bits as float, same
+    as skygear server which handles all numbers as float64.
+    """
+    if codec_name == CODEC_ORJSON:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+
+    return json.loads(data)
+
+
+def dumps_bytes(obj, sort_keys=False):
+    """
+    Encode an object to compact UTF-8 JSON bytes.
+
+    Objects that the fast codec would serialize differently from the json
+    module are encoded by the json module. The json module is configured
+    to produce the same bytes as orjson: non-ASCII characters are not
+    escaped and NaN and infinities are encoded as null, so the output does
+    not depend on whether orjson is installed.
+    """
+    if codec_name == CODEC_ORJSON:
+        option = ORJSON_DUMPS_OPTIONS
+        if sort_keys:
+            option = option | orjson.OPT_SORT_KEYS
+
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass
+
+    try:
+        data = stdlib_dumps(obj, sort_keys)
+    except ValueError:
+        # raised for out of range floats, which orjson encodes as null
+        obj = replace_non_finite(obj)
+        data = stdlib_dumps(obj, sort_keys)
+
+    try:
+        return data.encode('utf-8')
+    except UnicodeEncodeError:
+        # lone surrogates cannot be encoded as UTF-8, escape them
+        return stdlib_dumps(obj, sort_keys, ensure_ascii=True).encode('ascii')
+
+
+def stdlib_dumps(obj, sort_keys, ensure_ascii=False):
+    return json.dumps(
+        obj,
+        sort_keys=sort_keys,
+        separators=COMPACT_SEPARATORS,
+        ensure_ascii=ensure_ascii,
+        allow_nan=False)
+
+
+def replace_non_finite(obj):
+    """
+    Return a copy of obj with NaN and infinities replaced by None.
+    """
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    elif isinstance(obj, dict):
+        return {k: replace_non_finite(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [replace_non_finite(v) for v in obj]
+
+    return obj
+
+
+def dumps(obj):
+    """
+    Encode an object to a str formatted exactly like json.dumps does.
+
+    This is meant for human-facing output, e.g. CSV cells, where the
+    formatting has to stay stable. Use dumps_bytes for wire data.
+    """
+    return json.dumps(obj)
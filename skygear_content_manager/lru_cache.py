@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe LRU cache with per-entry expiry.
+
+    Entries are evicted in least-recently-used order once either the number
+    of entries exceeds max_entries, or the total size of entries exceeds
+    max_size. Each entry can be tagged so that a group of entries can be
+    invalidated together.
+    """
+
+    def __init__(self, ttl, max_entries=None, max_size=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses = self._misses + 1
+                return default
+
+            if entry.expire_at <= now:
+                self._remove(key)
+                self._misses = self._misses + 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits = self._hits + 1
+            return entry.value
+
+    def set(self, key, value, size=1, ttl=None, expire_at=None, tags=()):
+        """
+        Store a value.
+
+        The entry expires after ttl seconds (defaults to the cache ttl),
+        or at expire_at (time.monotonic() based) if that comes earlier.
+
+        A value larger than max_size is not stored, and the previous value
+        of the key is removed.
+        """
+        if self.max_size is not None and size > self.max_size:
+            self.delete(key)
+            return
+
+        entry_expire_at = time.monotonic() + \
+            (self.ttl if ttl is None else ttl)
+        if expire_at is not None:
+            entry_expire_at = min(entry_expire_at, expire_at)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = _Entry(value, size, entry_expire_at,
+                                        frozenset(tags))
+            self._size = self._size + size
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tags(self, tags):
+        tags = set(tags)
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e.tags & tags]
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size = self._size - entry.size
+
+    def _evict(self):
+        while self._entries and self._is_over_limit():
+            key = next(iter(self._entries))
+            self._remove(key)
+            self._evictions = self._evictions + 1
+
+    def _is_over_limit(self):
+        if self.max_entries is not None and \
+           len(self._entries) > self.max_entries:
+            return True
+
+        return self.max_size is not None and self._size > self.max_size
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expire_at', 'tags')
+
+    def __init__(self, value, size, expire_at, tags):
+        self.value = value
+        self.size = size
+        self.expire_at = expire_at
+        self.tags = tags
@@ -0,0 +1,310 @@
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+                   60)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# label values over this number of series are reported as "other"
+MAX_SERIES = 200
+OTHER_LABEL_VALUE = 'other'
+
+
+class Metric:
+    """
+    Base class of metrics with labels.
+
+    Samples are aggregated in memory, observing a sample costs a dict
+    lookup and a lock.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        key = tuple(label_value(labels.get(n)) for n in self.labelnames)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = tuple(OTHER_LABEL_VALUE for n in self.labelnames)
+        return key
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        with self._lock:
+            series = list(self._series.items())
+
+        for key, value in sorted(series):
+            lines = lines + self.render_series(key, value)
+
+        return lines
+
+    def render_series(self, key, value):
+        return [sample_line(self.name, self.labelnames, key, value)]
+
+
+class Counter(Metric):
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(Metric):
+
+    type = 'histogram'
+
+    def __init__(self,
+                 name,
+                 documentation,
+                 labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, sum, count
+                series = [[0] * len(self.buckets), 0, 0]
+                self._series[key] = series
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] = series[0][i] + 1
+            series[1] = series[1] + value
+            series[2] = series[2] + 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_series(self, key, value):
+        bucket_counts, total, count = value
+        labelnames = self.labelnames + ('le', )
+        lines = []
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            lines.append(
+                sample_line(self.name + '_bucket', labelnames,
+                            key + (format_value(bound), ), bucket_count))
+        lines.append(
+            sample_line(self.name + '_bucket', labelnames, key + ('+Inf', ),
+                        count))
+        lines.append(
+            sample_line(self.name + '_sum', self.labelnames, key, total))
+        lines.append(
+            sample_line(self.name + '_count', self.labelnames, key, count))
+        return lines
+
+
+class Registry:
+    """
+    Holds metrics and collectors, and renders them in Prometheus text
+    exposition format.
+
+    Collectors are functions called on render, for values that are
+    already kept elsewhere, e.g. pool and cache stats. A collector returns
+    a list of (name, type, documentation, [(labels, value)]).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines = lines + metric.render()
+
+        for collector in collectors:
+            for name, type, documentation, samples in collector():
+                lines.append('# HELP {} {}'.format(name, documentation))
+                lines.append('# TYPE {} {}'.format(name, type))
+                for labels, value in samples:
+                    labelnames = tuple(sorted(labels))
+                    key = tuple(str(labels[n]) for n in labelnames)
+                    lines.append(sample_line(name, labelnames, key, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+def sample_line(name, labelnames, key, value):
+    if not labelnames:
+        return '{} {}'.format(name, format_value(value))
+
+    labels = ','.join('{}="{}"'.format(n, escape_label_value(v))
+                      for n, v in zip(labelnames, key))
+    return '{}{{{}}} {}'.format(name, labels, format_value(value))
+
+
+def label_value(value):
+    if value is None:
+        return ''
+
+    return str(value)
+
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+
+    return str(value)
+
+
+registry = Registry()
+
+# proxy
+proxy_upstream_seconds = registry.histogram(
+    'cms_proxy_upstream_seconds',
+    'Time spent waiting for skygear server per proxied request.', ['action'])
+proxy_overhead_seconds = registry.histogram(
+    'cms_proxy_overhead_seconds',
+    'Time spent in the plugin per proxied request, excluding upstream.',
+    ['action'])
+upstream_request_seconds = registry.histogram(
+    'cms_upstream_request_seconds',
+    'Duration of requests sent to skygear server.', ['action'])
+upstream_request_errors = registry.counter(
+    'cms_upstream_request_errors_total',
+    'Requests to skygear server that failed without a response.', ['action'])
+
+# import and export
+import_rows = registry.counter('cms_import_rows_total',
+                               'Rows processed by imports.', ['name'])
+import_bytes = registry.counter(
+    'cms_import_bytes_total', 'Bytes of files processed by imports.', ['name'])
+import_seconds = registry.histogram('cms_import_seconds',
+                                    'Duration of imports.', ['name'])
+export_rows = registry.counter('cms_export_rows_total',
+                               'Rows written by exports.', ['name'])
+export_bytes = registry.counter('cms_export_bytes_total',
+                                'Bytes written by exports.', ['name'])
+export_seconds = registry.histogram('cms_export_seconds',
+                                    'Duration of exports.', ['name'])
+
+# push notifications
+push_audience_size = registry.histogram(
+    'cms_push_audience_size',
+    'Number of users targeted by push campaigns.',
+    buckets=SIZE_BUCKETS)
+push_dispatch_seconds = registry.histogram(
+    'cms_push_dispatch_seconds', 'Time spent dispatching push campaigns.')
+
+# database
+db_session_seconds = registry.histogram('cms_db_session_seconds',
+                                        'Duration of database sessions.')
+
+upstream_timer = threading.local()
+
+
+@contextmanager
+def measure_upstream():
+    """
+    Accumulate the time spent waiting for skygear server in the current
+    thread. Nested measurements are counted once.
+    """
+    depth = getattr(upstream_timer, 'depth', 0)
+    upstream_timer.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        upstream_timer.depth = depth
+        if depth == 0:
+            upstream_timer.elapsed = get_upstream_elapsed() + \
+                time.perf_counter() - start
+
+
+def get_upstream_elapsed():
+    return getattr(upstream_timer, 'elapsed', 0)
+
+
+@contextmanager
+def time_upstream_request(action):
+    """
+    Measure a request sent to skygear server.
+    """
+    start = time.perf_counter()
+    try:
+        with measure_upstream():
+            yield
+    except Exception:
+        upstream_request_errors.inc(action=action)
+        raise
+    finally:
+        upstream_request_seconds.observe(
+            time.perf_counter() - start, action=action)
+
+
+@contextmanager
+def time_proxy_request(action):
+    """
+    Measure a proxied request, splitting the elapsed time into the time
+    spent waiting for skygear server and the plugin overhead.
+    """
+    upstream_timer.elapsed = 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        upstream = get_upstream_elapsed()
+        proxy_upstream_seconds.observe(upstream, action=action)
+        proxy_overhead_seconds.observe(
+            max(elapsed - upstream, 0), action=action)
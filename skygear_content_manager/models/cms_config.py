@@ -62,6 +62,16 @@ class CMSRecordExport:
     def get_many_reference_fields(self):
         return [f for f in self.fields if f.reference and f.reference.is_many]
 
+    def get_record_types(self):
+        """
+        Return the record types that the parsed export depends on.
+        """
+        record_types = {self.record_type}
+        for field in self.fields:
+            record_types.update(field.get_record_types())
+
+        return record_types
+
 
 class CMSRecordExportField:
     def __init__(self,
@@ -78,6 +88,13 @@ class CMSRecordExportField:
         self.format = format
         self.reference = reference
 
+    def get_record_types(self):
+        record_types = {self.record_type}
+        if self.reference:
+            record_types.update(self.reference.get_record_types())
+
+        return record_types
+
 
 class CMSRecordReference:
     def __init__(self,
@@ -98,6 +115,15 @@ class CMSRecordReference:
     def is_many(self):
         raise NotImplementedError('is_many not implemented.')
 
+    def get_record_types(self):
+        record_types = {self.target_record_type}
+        for field in self.target_fields:
+            # export fields, or skygear fields of an import reference
+            if hasattr(field, 'get_record_types'):
+                record_types.update(field.get_record_types())
+
+        return record_types
+
 
 class CMSRecordDirectReference(CMSRecordReference):
     @property
@@ -158,6 +184,15 @@ class CMSRecordAssociationReference(CMSRecordReference):
     def is_many(self):
         return True
 
+    def get_record_types(self):
+        record_types = super(CMSRecordAssociationReference,
+                             self).get_record_types()
+        record_types.add(self.association_record.record_type)
+        for field in self.association_record.fields:
+            record_types.add(field.target_cms_record.record_type)
+
+        return record_types
+
 
 class CMSAssociationRecord:
     def __init__(self, name, record_type, fields):
@@ -193,6 +228,18 @@ class CMSRecordImport:
     def get_reference_fields(self):
         return [f for f in self.fields if f.reference]
 
+    def get_record_types(self):
+        """
+        Return the record types that the parsed import depends on.
+        """
+        record_types = {self.record_type}
+        for field in self.fields:
+            record_types.add(field.record_type)
+            if field.reference:
+                record_types.update(field.reference.get_record_types())
+
+        return record_types
+
 
 class CMSRecordImportLimitConfig:
     def __init__(self, record_number=None, file_size=None):
@@ -32,18 +32,38 @@ reserved_fields = {
 
 
 class SkygearSchema:
+    """
+    Record types of skygear schema, indexed by record type and field name.
+
+    Fields are shared by all lookups and must not be modified.
+    """
+
     def __init__(self, record_types):
         self.record_types = record_types
 
     def field_of(self, record_type, field_name):
-        if field_name in reserved_fields:
-            return SkygearField.from_dict(reserved_fields[field_name])
+        reserved_field = RESERVED_FIELDS.get(field_name)
+        if reserved_field is not None:
+            return reserved_field
 
-        fields = [
-            t for t in self.record_types[record_type].fields
-            if t.name == field_name
-        ]
-        return fields[0] if len(fields) > 0 else None
+        return self.record_types[record_type].fields_by_name.get(field_name)
+
+    @property
+    def has_asset_field(self):
+        return any(r.has_asset_field for r in self.record_types.values())
+
+    def changed_record_types(self, other):
+        """
+        Return the record types that are added, removed or have different
+        fields in the other schema.
+        """
+        record_types = set(self.record_types) ^ set(other.record_types)
+        for record_type in set(self.record_types) & set(other.record_types):
+            if self.record_types[record_type].signature != \
+               other.record_types[record_type].signature:
+                record_types.add(record_type)
+
+        return record_types
 
 
 class SkygearRecord:
@@ -51,6 +71,17 @@ class SkygearRecord:
         self.record_type = record_type
         self.fields = fields
 
+        self.fields_by_name = {}
+        for field in fields:
+            # the first field wins if a name is duplicated
+            self.fields_by_name.setdefault(field.name, field)
+
+        self.has_asset_field = any(f.type == 'asset' for f in fields)
+
+    @property
+    def signature(self):
+        return tuple((f.name, f.type) for f in self.fields)
+
 
 class SkygearField:
     def __init__(self, name, type):
@@ -74,3 +105,9 @@ class SkygearField:
             return None
 
         return self.type[4:-1]
+
+
+RESERVED_FIELDS = {
+    name: SkygearField.from_dict(d)
+    for name, d in reserved_fields.items()
+}
@@ -0,0 +1,182 @@
+import threading
+
+from .lru_cache import LRUCache
+from .settings import CMS_PROXY_CACHE_ACTIONS
+from .settings import CMS_PROXY_CACHE_ENABLED
+from .settings import CMS_PROXY_CACHE_MAX_BYTES
+from .settings import CMS_PROXY_CACHE_TTL
+from .skygear_utils import request_key
+
+TAG_SCHEMA = 'schema'
+# queries with includes embed records of other record types
+TAG_INCLUDES = 'includes'
+
+RECORD_WRITE_ACTIONS = [
+    'record:save',
+    'record:delete',
+]
+
+proxy_response_cache = None
+proxy_response_cache_lock = threading.Lock()
+
+
+class ProxyResponseCache:
+    """
+    Cache responses of read-only actions passing through the cms-api proxy.
+
+    Responses are keyed by the action, the request body and the identity
+    making the request. Cached record queries are invalidated when a
+    record:save or record:delete of the same record type passes through
+    the proxy or request_skygear_api, cached schema is invalidated by schema actions and the
+    schema-changed event.
+    """
+
+    def __init__(self,
+                 enabled=CMS_PROXY_CACHE_ENABLED,
+                 actions=CMS_PROXY_CACHE_ACTIONS,
+                 ttl=CMS_PROXY_CACHE_TTL,
+                 max_bytes=CMS_PROXY_CACHE_MAX_BYTES):
+        self.enabled = enabled
+        self.actions = set(actions)
+        self.cache = LRUCache(ttl=ttl, max_size=max_bytes)
+
+    @classmethod
+    def get_instance(cls):
+        global proxy_response_cache
+        if proxy_response_cache is None:
+            with proxy_response_cache_lock:
+                if proxy_response_cache is None:
+                    proxy_response_cache = cls()
+
+        return proxy_response_cache
+
+    # req: SkygearRequest
+    def is_cacheable(self, req):
+        return self.enabled and req.action in self.actions
+
+    # req: SkygearRequest
+    def get(self, req):
+        resp = self.cache.get(request_key(req))
+        if resp is None:
+            return None
+
+        return resp.copy()
+
+    # req: SkygearRequest
+    # resp: SkygearResponse
+    def set(self, req, resp):
+        if resp.status_code != 200 or resp.error_code or resp.stream:
+            return
+
+        resp = resp.copy()
+        size = len(resp.body.to_data() or b'')
+        self.cache.set(request_key(req), resp, size=size, tags=cache_tags(req))
+
+    # req: SkygearRequest
+    def invalidate_for(self, req):
+        """
+        Invalidate cached responses affected by the request, if it is a
+        record or schema write.
+        """
+        if not self.enabled:
+            return
+
+        action = req.action
+        if not action:
+            return
+
+        if action.startswith('schema:') and action != 'schema:fetch':
+            self.invalidate_schema()
+        elif action in RECORD_WRITE_ACTIONS:
+            record_types = written_record_types(req.body.data)
+            if record_types is None:
+                self.cache.clear()
+                return
+
+            self.cache.invalidate_tags(
+                [record_type_tag(t) for t in record_types] + [TAG_INCLUDES])
+
+    def invalidate_schema(self):
+        self.cache.invalidate_tags([TAG_SCHEMA])
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['enabled'] = self.enabled
+        return stats
+
+
+# req: SkygearRequest
+def cache_tags(req):
+    action = req.action
+    if action == 'schema:fetch':
+        return [TAG_SCHEMA]
+
+    data = req.body.data
+    tags = []
+    record_type = data.get('record_type')
+    if isinstance(record_type, str) and record_type:
+        tags.append(record_type_tag(record_type))
+
+    if data.get('include'):
+        tags.append(TAG_INCLUDES)
+
+    return tags
+
+
+def record_type_tag(record_type):
+    return 'record_type:' + record_type
+
+
+def written_record_types(data):
+    """
+    Record types written by a record:save or record:delete request body.
+
+    Returns None if the record types cannot be determined.
+    """
+    record_types = set()
+
+    record_type = data.get('record_type')
+    if record_type is not None and not isinstance(record_type, str):
+        return None
+
+    if record_type:
+        record_types.add(record_type)
+
+    ids = data.get('ids') or []
+    records = data.get('records') or []
+    if not isinstance(ids, list) or not isinstance(records, list):
+        return None
+
+    for record_id in ids:
+        if not isinstance(record_id, str) or '/' not in record_id:
+            if not record_type:
+                return None
+            continue
+        record_types.add(record_id.split('/')[0])
+
+    for record in records:
+        record_type = saved_record_type(record)
+        if record_type is None:
+            return None
+        record_types.add(record_type)
+
+    return record_types if record_types else None
+
+
+def saved_record_type(record):
+    """
+    Record type of a record in a record:save request body, or None if it
+    cannot be determined.
+    """
+    if not isinstance(record, dict):
+        return None
+
+    record_type = record.get('_recordType')
+    if record_type:
+        return record_type if isinstance(record_type, str) else None
+
+    record_id = record.get('_id')
+    if not isinstance(record_id, str) or '/' not in record_id:
+        return None
+
+    return record_id.split('/')[0]
@@ -3,6 +3,7 @@ from marshmallow import Schema
 from marshmallow import fields
 from skygear.utils import db
 
+from .. import metrics
 from ..db_session import scoped_session
 from ..models.push_campaign import CmsPushCampaign
 from ..models.push_campaign import CmsPushCampaignUser
@@ -60,8 +61,10 @@ def register_lambda(settings):
         user_ids = new_push_campaign['userIds']
         message_content = new_push_campaign['content']
         message_title = new_push_campaign.get('title', '')
-        PushNotificationHelper().push_to_users(user_ids, message_title,
-                                               message_content)
+        metrics.push_audience_size.observe(len(user_ids))
+        with metrics.push_dispatch_seconds.time():
+            PushNotificationHelper().push_to_users(user_ids, message_title,
+                                                   message_content)
         _create_cms_push_campaign(new_push_campaign)
         return {'result': 'ok'}
 
@@ -1,9 +1,14 @@
+from collections import namedtuple
+
 from sqlalchemy import not_
 
 from .models.cms_config import CMSRecordAssociationReference
 from .models.cms_config import CMSRecordBackReference
+from .skygear_async_utils import fetch_all_records_async
+from .skygear_async_utils import gather
+from .skygear_async_utils import run_sync
 from .skygear_utils import eq_predicate
-from .skygear_utils import fetch_records
+from .skygear_utils import iter_records
 from .skygear_utils import or_predicate
 
 
@@ -49,35 +54,36 @@ def apply_filters(query, filters, col_map):
     return query
 
 
-def fetch_records_by_values_in_key(record_type, key, values):
+def iter_records_by_values_in_key(record_type, key, values):
+    """
+    Iterate the records with the key in values, fetched page by page.
+    """
     if len(values) == 0:
-        return []
+        return iter([])
 
     value_predicates = [eq_predicate(key, v) for v in values]
     predicate = or_predicate(value_predicates)
-    return fetch_records(record_type, predicate)
+    return iter_records(record_type, predicate)
 
 
-def transient_foreign_records(record, export_config, association_records):
-    """
-    Fetch and embed foreign records, with one-to-many or many-to-many
-    relationship, to _transient of the record.
+# How to fetch the foreign records of a many-reference field.
+# Records of record_type with self_field referencing the record are
+# fetched. For association records, the records referenced by their
+# foreign_field are taken, otherwise foreign_field is None.
+ForeignLookup = namedtuple(
+    'ForeignLookup',
+    ['field_name', 'record_type', 'self_field', 'foreign_field'])
 
-    For example, each "user" record has many "skill", with config field
-    name "user_has_skill". This function would fetch "skill" records that
-    are referenced by the "user" record, and embed the "skill" record list in
-    user['_transient']['user_has_skill'].
-    """
-    reference_fields = export_config.get_many_reference_fields()
-    record_id = record['_id'].split('/')[1]
 
-    for field in reference_fields:
+def get_foreign_lookups(export_config):
+    """
+    Resolve the foreign lookups of the many-reference fields of an export.
+    """
+    lookups = []
+    for field in export_config.get_many_reference_fields():
         reference = field.reference
-        records = None
-
         if isinstance(reference, CMSRecordAssociationReference):
-            association_record = association_records[
-                reference.association_record.name]
+            association_record = reference.association_record
 
             foreign_field = \
                 [f for f in association_record.fields
@@ -87,25 +93,61 @@ def transient_foreign_records(record, export_config, association_records):
                 [f for f in association_record.fields
                  if f.target_cms_record.name != reference.target_reference][0]
 
-            predicate = eq_predicate(self_field.name, record_id)
-            foreign_records = fetch_records(
-                reference.association_record.record_type,
-                predicate=predicate,
-                includes=[foreign_field.name])
-            records = \
-                [r['_transient'][foreign_field.name] for r in foreign_records]
+            lookups.append(
+                ForeignLookup(
+                    field_name=field.name,
+                    record_type=association_record.record_type,
+                    self_field=self_field.name,
+                    foreign_field=foreign_field.name))
         elif isinstance(reference, CMSRecordBackReference):
-            predicate = eq_predicate(reference.source_reference, record_id)
-            records = fetch_records(
-                reference.target_cms_record.record_type, predicate=predicate)
-        else:
-            # skip for direct reference
-            continue
+            lookups.append(
+                ForeignLookup(
+                    field_name=field.name,
+                    record_type=reference.target_cms_record.record_type,
+                    self_field=reference.source_reference,
+                    foreign_field=None))
+
+    return tuple(lookups)
+
+
+def transient_lookup_records_many(records, lookups):
+    """
+    Fetch and embed the foreign records of the lookups, resolved by
+    get_foreign_lookups, to _transient of the records.
+
+    For example, each "user" record has many "skill", with config field
+    name "user_has_skill". This function would fetch "skill" records that
+    are referenced by the "user" record, and embed the "skill" record list in
+    user['_transient']['user_has_skill'].
+
+    Foreign records of every record and lookup are fetched concurrently.
+    """
+    run_sync(
+        gather([
+            transient_lookup_records_async(record, lookup)
+            for record in records for lookup in lookups
+        ]))
+
+
+async def transient_lookup_records_async(record, lookup):
+    record_id = record['_id'].split('/')[1]
+    predicate = eq_predicate(lookup.self_field, record_id)
+
+    if lookup.foreign_field is not None:
+        foreign_records = await fetch_all_records_async(
+            lookup.record_type,
+            predicate=predicate,
+            includes=[lookup.foreign_field])
+        records = \
+            [r['_transient'][lookup.foreign_field] for r in foreign_records]
+    else:
+        records = await fetch_all_records_async(
+            lookup.record_type, predicate=predicate)
 
-        if '_transient' not in record:
-            record['_transient'] = {}
+    if '_transient' not in record:
+        record['_transient'] = {}
 
-        record['_transient'][field.name] = records
+    record['_transient'][lookup.field_name] = records
 
 
 def escape_sql_like(rawString):
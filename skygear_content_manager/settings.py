@@ -43,3 +43,170 @@ except ValueError:
     pass
 except TypeError:
     pass
+
+
+def _get_int_env(name, default):
+    try:
+        return int(os.environ.get(name))
+    except (ValueError, TypeError):
+        return default
+
+
+def _get_float_env(name, default):
+    try:
+        return float(os.environ.get(name))
+    except (ValueError, TypeError):
+        return default
+
+
+def _get_list_env(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _get_float_map_env(name, default):
+    """
+    Parse "key=value,key=value" into a dict of float values.
+    """
+    result = dict(default)
+    for item in _get_list_env(name, []):
+        key, _, value = item.partition('=')
+        try:
+            result[key.strip()] = float(value)
+        except ValueError:
+            pass
+
+    return result
+
+
+# refresh the cms config in the background, 0 to refresh on reload only
+CMS_CONFIG_REFRESH_INTERVAL = \
+    _get_float_env('CMS_CONFIG_REFRESH_INTERVAL', 0)  # in seconds
+
+# file to keep the parsed cms config across restarts, unset to disable
+CMS_CONFIG_SNAPSHOT_PATH = os.environ.get('CMS_CONFIG_SNAPSHOT_PATH')
+
+# broadcast config reloads to other plugin processes with postgres NOTIFY,
+# each process keeps a connection open to LISTEN
+CMS_CONFIG_INVALIDATION_ENABLED = os.environ.get(
+    'CMS_CONFIG_INVALIDATION_ENABLED', 'false').lower() == 'true'
+CMS_CONFIG_INVALIDATION_DEBOUNCE = \
+    _get_float_env('CMS_CONFIG_INVALIDATION_DEBOUNCE', 1)  # in seconds
+
+# cms config parser, "schema" uses the marshmallow schemas, "fast" builds
+# the config directly and falls back to the schemas on errors
+CMS_CONFIG_PARSER = os.environ.get('CMS_CONFIG_PARSER', 'schema')
+
+# let the cms client load the config from cms-api/config.json, instead of
+# loading the YAML config file itself
+CMS_CLIENT_CONFIG_JSON = \
+    os.environ.get('CMS_CLIENT_CONFIG_JSON', 'false').lower() == 'true'
+
+# load the config and open connections before the plugin reports ready
+CMS_WARM_UP = os.environ.get('CMS_WARM_UP', 'false').lower() == 'true'
+CMS_WARM_UP_TIMEOUT = _get_float_env('CMS_WARM_UP_TIMEOUT', 60)  # in seconds
+
+# skygear upstream connection pool
+CMS_UPSTREAM_POOL_SIZE = _get_int_env('CMS_UPSTREAM_POOL_SIZE', 10)
+CMS_UPSTREAM_CONNECT_TIMEOUT = \
+    _get_float_env('CMS_UPSTREAM_CONNECT_TIMEOUT', 5)  # in seconds
+CMS_UPSTREAM_READ_TIMEOUT = \
+    _get_float_env('CMS_UPSTREAM_READ_TIMEOUT', 60)  # in seconds
+CMS_UPSTREAM_MAX_RETRIES = _get_int_env('CMS_UPSTREAM_MAX_RETRIES', 2)
+# actions that are safe to be sent again after a failed attempt
+CMS_UPSTREAM_IDEMPOTENT_ACTIONS = _get_list_env(
+    'CMS_UPSTREAM_IDEMPOTENT_ACTIONS', [
+        'me',
+        'record:query',
+        'schema:fetch',
+    ])
+
+# read timeouts of specific actions, e.g. "record:save=120,schema:fetch=10"
+CMS_UPSTREAM_ACTION_TIMEOUTS = \
+    _get_float_map_env('CMS_UPSTREAM_ACTION_TIMEOUTS', {})  # in seconds
+
+# time limits for all skygear requests made while handling one request
+CMS_REQUEST_DEADLINE = _get_float_env('CMS_REQUEST_DEADLINE', 60)  # in seconds
+CMS_IMPORT_EXPORT_DEADLINE = \
+    _get_float_env('CMS_IMPORT_EXPORT_DEADLINE', 600)  # in seconds
+
+# stop sending requests to skygear server while it is failing, only
+# errors and timeouts are counted as failures
+CMS_UPSTREAM_BREAKER_ENABLED = \
+    os.environ.get('CMS_UPSTREAM_BREAKER_ENABLED', 'false').lower() == 'true'
+CMS_UPSTREAM_BREAKER_WINDOW = _get_int_env('CMS_UPSTREAM_BREAKER_WINDOW', 50)
+CMS_UPSTREAM_BREAKER_MIN_CALLS = \
+    _get_int_env('CMS_UPSTREAM_BREAKER_MIN_CALLS', 20)
+CMS_UPSTREAM_BREAKER_FAILURE_RATE = \
+    _get_float_env('CMS_UPSTREAM_BREAKER_FAILURE_RATE', 0.5)
+CMS_UPSTREAM_BREAKER_OPEN_DURATION = \
+    _get_float_env('CMS_UPSTREAM_BREAKER_OPEN_DURATION', 30)  # in seconds
+
+# maximum number of concurrent skygear requests issued by one fan-out
+CMS_UPSTREAM_CONCURRENCY = \
+    _get_int_env('CMS_UPSTREAM_CONCURRENCY', CMS_UPSTREAM_POOL_SIZE)
+
+# stream proxied responses that are not inspected by the plugin
+CMS_PROXY_STREAMING = \
+    os.environ.get('CMS_PROXY_STREAMING', 'true').lower() == 'true'
+CMS_PROXY_STREAM_CHUNK_SIZE = \
+    _get_int_env('CMS_PROXY_STREAM_CHUNK_SIZE', 64 * 1024)  # in bytes
+
+# cache responses of read-only actions passing through the cms-api proxy
+CMS_PROXY_CACHE_ENABLED = \
+    os.environ.get('CMS_PROXY_CACHE_ENABLED', 'false').lower() == 'true'
+CMS_PROXY_CACHE_TTL = _get_float_env('CMS_PROXY_CACHE_TTL', 30)  # in seconds
+CMS_PROXY_CACHE_MAX_BYTES = \
+    _get_int_env('CMS_PROXY_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+CMS_PROXY_CACHE_ACTIONS = _get_list_env('CMS_PROXY_CACHE_ACTIONS', [
+    'record:query',
+    'schema:fetch',
+])
+
+# share one upstream call between concurrent identical read requests,
+# coalesced responses are buffered instead of streamed
+CMS_PROXY_COALESCING = \
+    os.environ.get('CMS_PROXY_COALESCING', 'false').lower() == 'true'
+CMS_PROXY_COALESCE_ACTIONS = _get_list_env('CMS_PROXY_COALESCE_ACTIONS', [
+    'record:query',
+    'schema:fetch',
+])
+
+# cache of verified cms auth tokens
+CMS_AUTH_TOKEN_CACHE_SIZE = _get_int_env('CMS_AUTH_TOKEN_CACHE_SIZE', 1024)
+CMS_AUTH_TOKEN_CACHE_TTL = \
+    _get_float_env('CMS_AUTH_TOKEN_CACHE_TTL', 300)  # in seconds
+
+# cache of intercepted me calls, role changes take effect after the max age
+CMS_ME_CACHE_SIZE = _get_int_env('CMS_ME_CACHE_SIZE', 1024)
+CMS_ME_CACHE_MAX_AGE = _get_float_env('CMS_ME_CACHE_MAX_AGE', 30)  # in seconds
+
+# gzip compression of proxied responses
+CMS_PROXY_GZIP = os.environ.get('CMS_PROXY_GZIP', 'true').lower() == 'true'
+CMS_PROXY_GZIP_MIN_SIZE = \
+    _get_int_env('CMS_PROXY_GZIP_MIN_SIZE', 1024)  # in bytes
+CMS_PROXY_GZIP_LEVEL = _get_int_env('CMS_PROXY_GZIP_LEVEL', 6)
+# ask skygear server for gzip compressed responses
+CMS_UPSTREAM_ACCEPT_GZIP = \
+    os.environ.get('CMS_UPSTREAM_ACCEPT_GZIP', 'true').lower() == 'true'
+
+# json codec, "auto" uses orjson when installed, "json" forces the json module
+CMS_JSON_CODEC = os.environ.get('CMS_JSON_CODEC', 'auto')
+
+# maximum number of actions in one cms-api/batch request
+CMS_BATCH_MAX_ACTIONS = _get_int_env('CMS_BATCH_MAX_ACTIONS', 50)
+
+# number of records fetched per record:query when walking large result sets
+CMS_RECORD_PAGE_SIZE = _get_int_env('CMS_RECORD_PAGE_SIZE', 1000)
+
+# csv export, records are fetched page by page and rows are written out as
+# they are serialized
+CMS_EXPORT_PAGE_SIZE = \
+    _get_int_env('CMS_EXPORT_PAGE_SIZE', CMS_RECORD_PAGE_SIZE)
+# rows of exports with spread columns are kept in memory up to this size
+# while the columns are sized, and spilled to disk beyond it
+CMS_EXPORT_SPILL_MEMORY = \
+    _get_int_env('CMS_EXPORT_SPILL_MEMORY', 8 * 1024 * 1024)  # in bytes
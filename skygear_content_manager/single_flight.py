@@ -0,0 +1,61 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key.
+
+    While a call for a key is in flight, other callers with the same key
+    wait for it and receive its result, or its exception, instead of making
+    the call again. Results are not kept after the call returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._total = 0
+        self._coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            self._total = self._total + 1
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self._coalesced = self._coalesced + 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'calls': self._total,
+                'coalesced': self._coalesced,
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
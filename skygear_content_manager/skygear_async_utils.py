@@ -0,0 +1,94 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import deadline
+from .settings import CMS_UPSTREAM_CONCURRENCY
+from .settings import CMS_UPSTREAM_POOL_SIZE
+from .skygear_utils import fetch_records
+from .skygear_utils import get_schema
+from .skygear_utils import iter_records
+from .skygear_utils import request_skygear
+from .skygear_utils import request_skygear_api
+from .skygear_utils import save_records
+
+# Requests still go through the pooled UpstreamTransport, the blocking
+# calls run in this thread pool so that independent requests can be issued
+# concurrently.
+executor = ThreadPoolExecutor(max_workers=CMS_UPSTREAM_POOL_SIZE)
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion in a new event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def run_in_executor(fn, *args, **kwargs):
+    """
+    Call fn in the executor, with the deadline of the calling thread.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(call_with_deadline, deadline.current(), fn, *args,
+                          **kwargs))
+
+
+def call_with_deadline(at, fn, *args, **kwargs):
+    with deadline.deadline_at(at):
+        return fn(*args, **kwargs)
+
+
+async def gather(aws, limit=CMS_UPSTREAM_CONCURRENCY):
+    """
+    Like asyncio.gather, but at most `limit` awaitables run at once.
+
+    Results are returned in the order of `aws`.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[run(aw) for aw in aws])
+
+
+# req: SkygearRequest
+async def request_skygear_async(req):
+    return await run_in_executor(request_skygear, req)
+
+
+async def request_skygear_api_async(action, data={}, is_master=True):
+    return await run_in_executor(request_skygear_api, action, data, is_master)
+
+
+async def get_schema_async():
+    return await run_in_executor(get_schema)
+
+
+async def save_records_async(records, database_id='_public', atomic=False):
+    return await run_in_executor(save_records, records, database_id, atomic)
+
+
+async def fetch_records_async(record_type, predicate=None, includes=[]):
+    return await run_in_executor(fetch_records, record_type, predicate,
+                                 includes)
+
+
+async def fetch_all_records_async(record_type, predicate=None, includes=[]):
+    """
+    Fetch all the records matching the predicate, page by page with
+    iter_records.
+    """
+
+    def fetch_all():
+        return list(iter_records(record_type, predicate, includes))
+
+    return await run_in_executor(fetch_all)
@@ -1,4 +1,6 @@
-import json
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import requests
@@ -7,21 +9,70 @@ from jose import JWTError
 from jose import jwt
 from skygear.error import AccessTokenNotAccepted
 from skygear.error import PermissionDenied
+from skygear.error import PluginTimeout
+from skygear.error import PluginUnavailable
 from skygear.error import SkygearException
 from skygear.options import options
 from skygear.utils.context import current_context
 
+from . import deadline
+from . import json_codec
+from . import metrics
+from .circuit_breaker import CircuitOpenError
+from .compression import GzipStream
+from .compression import gzip_data
+from .compression import is_compressible
+from .deadline import DeadlineExceeded
+from .lru_cache import LRUCache
 from .settings import CMS_AUTH_SECRET
+from .settings import CMS_AUTH_TOKEN_CACHE_SIZE
+from .settings import CMS_AUTH_TOKEN_CACHE_TTL
+from .settings import CMS_PROXY_COALESCE_ACTIONS
+from .settings import CMS_PROXY_COALESCING
+from .settings import CMS_RECORD_PAGE_SIZE
+from .settings import CMS_UPSTREAM_ACCEPT_GZIP
+from .settings import CMS_UPSTREAM_POOL_SIZE
+from .single_flight import SingleFlight
+from .upstream import UpstreamTransport
 
 REQUEST_HEADER_BLACKLIST = [
     'Host',
     'Accept-Encoding',
 ]
+# keys that are part of the identity rather than the request
+IDENTITY_KEYS = [
+    'access_token',
+    'api_key',
+]
+
+# sorts records in the order of creation, _id breaks ties
+CREATION_ORDER = [
+    [{
+        '$type': 'keypath',
+        '$val': '_created_at'
+    }, 'asc'],
+    [{
+        '$type': 'keypath',
+        '$val': '_id'
+    }, 'asc'],
+]
+
+upstream_flight = SingleFlight()
+
+# fetches the next pages of fetch_record_pages in the background
+page_executor = ThreadPoolExecutor(max_workers=CMS_UPSTREAM_POOL_SIZE)
+
+verified_token_cache = LRUCache(
+    ttl=CMS_AUTH_TOKEN_CACHE_TTL, max_entries=CMS_AUTH_TOKEN_CACHE_SIZE)
+
 RESPONSE_HEADER_BLACKLIST = [
     'Access-Control-Allow-Credentials',
     'Access-Control-Allow-Origin',
+    'Connection',
     'Content-Encoding',
+    'Keep-Alive',
     'Server',
+    'Transfer-Encoding',
 ]
 
 
@@ -55,10 +106,19 @@ class SkygearRequest:
     @access_token.setter
     def access_token(self, access_token):
         if self.body.is_dict:
-            self.body.data['access_token'] = access_token
+            self.body.set('access_token', access_token)
 
         self.headers['X-Skygear-Access-Token'] = access_token
 
+    @property
+    def action(self):
+        if self.body.is_dict:
+            action = self.body.data.get('action')
+            if isinstance(action, str):
+                return action
+
+        return None
+
     def to_requests(self):
         method = self.method
         # TODO: should clone body here
@@ -71,9 +131,12 @@ class SkygearRequest:
 
         if self.is_master:
             if body.is_dict:
-                body.data['api_key'] = options.masterkey
+                body.set('api_key', options.masterkey)
             headers['X-Skygear-Api-Key'] = options.masterkey
 
+        if CMS_UPSTREAM_ACCEPT_GZIP:
+            headers['Accept-Encoding'] = 'gzip'
+
         return requests.Request(
             method=method,
             url=options.skygear_endpoint,
@@ -85,13 +148,20 @@ class SkygearRequest:
 class SkygearResponse:
 
     # resp: requests response
-    def __init__(self, status_code, headers, cookies, body, error_code=None):
+    def __init__(self,
+                 status_code,
+                 headers,
+                 cookies,
+                 body,
+                 error_code=None,
+                 stream=None):
         self.error_code = error_code
 
         self.status_code = status_code
         self.headers = headers
         self.body = body
         self.cookies = cookies
+        self.stream = stream
 
     @classmethod
     def forbidden(cls):
@@ -113,6 +183,26 @@ class SkygearResponse:
             error_code=AccessTokenNotAccepted,
         )
 
+    @classmethod
+    def upstream_unavailable(cls):
+        return cls(
+            status_code=cls.error_status_code(PluginUnavailable),
+            headers=None,
+            body=None,
+            cookies=None,
+            error_code=PluginUnavailable,
+        )
+
+    @classmethod
+    def upstream_timeout(cls):
+        return cls(
+            status_code=cls.error_status_code(PluginTimeout),
+            headers=None,
+            body=None,
+            cookies=None,
+            error_code=PluginTimeout,
+        )
+
     @classmethod
     def from_requests(cls, resp):
         status_code = resp.status_code
@@ -127,6 +217,46 @@ class SkygearResponse:
             cookies=cookies,
         )
 
+    # stream: upstream.UpstreamStream
+    @classmethod
+    def from_upstream_stream(cls, stream):
+        resp = stream.response
+        headers = {
+            k: v
+            for k, v in resp.headers.items()
+            # body is decoded while streaming, length no longer matches
+            if not (stream.is_encoded and k.lower() == 'content-length')
+        }
+
+        return cls(
+            status_code=resp.status_code,
+            headers=headers,
+            body=None,
+            cookies=resp.cookies,
+            stream=stream,
+        )
+
+    def copy(self):
+        """
+        Return a copy that can be modified independently.
+
+        Streamed responses cannot be copied.
+        """
+        if self.stream:
+            raise ValueError('Streamed response cannot be copied')
+
+        body = self.body
+        if body is not None:
+            body = Body(body.to_data())
+
+        return SkygearResponse(
+            status_code=self.status_code,
+            headers=dict(self.headers) if self.headers is not None else None,
+            cookies=self.cookies.copy() if self.cookies is not None else None,
+            body=body,
+            error_code=self.error_code,
+        )
+
     @property
     def access_token(self):
         if self.body.is_dict:
@@ -144,6 +274,7 @@ class SkygearResponse:
     def access_token(self, access_token):
         if self.body.is_dict:
             self.body.data['result']['access_token'] = access_token
+            self.body.mark_modified()
 
         self.headers['X-Skygear-Access-Token'] = access_token
         self.cookies['X-Skygear-Access-Token'] = access_token
@@ -154,6 +285,10 @@ class SkygearResponse:
             return 'You are not permitted to access CMS.'
         elif error_code == AccessTokenNotAccepted:
             return 'Access token is invalid.'
+        elif error_code == PluginUnavailable:
+            return 'Skygear server is unavailable.'
+        elif error_code == PluginTimeout:
+            return 'Skygear server did not respond in time.'
 
         return 'An unexpected error has occurred.'
 
@@ -163,6 +298,10 @@ class SkygearResponse:
             return 'PermissionDenied'
         elif error_code == AccessTokenNotAccepted:
             return 'AccessTokenNotAccepted'
+        elif error_code == PluginUnavailable:
+            return 'PluginUnavailable'
+        elif error_code == PluginTimeout:
+            return 'PluginTimeout'
 
         return 'UnexpectedError'
 
@@ -172,68 +311,145 @@ class SkygearResponse:
             return 403
         elif error_code == AccessTokenNotAccepted:
             return 401
+        elif error_code == PluginUnavailable:
+            return 503
+        elif error_code == PluginTimeout:
+            return 504
 
         return 500
 
     @classmethod
-    def error_werkzeug(cls, error_code):
-        data = {
+    def error_dict(cls, error_code):
+        return {
             'error': {
                 'code': error_code,
                 'message': cls.error_message(error_code),
                 'name': cls.error_name(error_code),
             }
         }
+
+    @classmethod
+    def error_werkzeug(cls, error_code):
         return skygear.Response(
-            json.dumps(data).encode('utf-8'),
+            json_codec.dumps_bytes(cls.error_dict(error_code)),
             cls.error_status_code(error_code),
             mimetype='application/json',
         )
 
-    def to_werkzeug(self):
+    def to_werkzeug(self, accept_gzip=False):
+        """
+        Build the werkzeug response.
+
+        If accept_gzip is True, compressible responses are sent with gzip
+        content encoding. Streamed responses already compressed by skygear
+        server are passed through without being decompressed.
+        """
         if self.error_code:
             return SkygearResponse.error_werkzeug(self.error_code)
 
         filtered_headers = [(k, v) for k, v in self.headers.items()
                             if k not in RESPONSE_HEADER_BLACKLIST]
+        content_type = get_header(self.headers, 'Content-Type')
+
+        if self.stream:
+            response = self.stream
+            is_gzip = False
+            if accept_gzip and self.stream.is_gzip:
+                self.stream.decode_content = False
+                is_gzip = True
+            elif accept_gzip and is_compressible(content_type,
+                                                 self.stream.content_length):
+                response = GzipStream(self.stream)
+                is_gzip = True
+
+            if is_gzip:
+                filtered_headers = [(k, v) for k, v in filtered_headers
+                                    if k.lower() != 'content-length']
+        else:
+            response = self.body.to_data()
+            is_gzip = accept_gzip and \
+                is_compressible(content_type, len(response or b''))
+            if is_gzip:
+                response = gzip_data(response)
+
+        if is_gzip:
+            filtered_headers.append(('Content-Encoding', 'gzip'))
+            filtered_headers.append(('Vary', 'Accept-Encoding'))
 
         resp = skygear.Response(
-            response=self.body.to_data(),
+            response=response,
             status=str(self.status_code),
             headers=filtered_headers,
         )
 
-        for k, v in self.cookies.iteritems():
+        for k, v in self.cookies.items():
             resp.set_cookie(k, v)
 
         return resp
 
 
+def get_header(headers, name):
+    name = name.lower()
+    for k, v in headers.items():
+        if k.lower() == name:
+            return v
+
+    return None
+
+
 class Body:
+    """
+    A request or response body.
+
+    The original bytes are kept as is and only parsed as JSON when the
+    data is accessed. to_data() returns the original bytes if the body is
+    not modified.
+
+    Top-level keys that are absent from the body can be set with set()
+    without re-serializing the whole body, the keys are appended to the end
+    of the original JSON object. Setting a key that already exists marks
+    the body as modified, so that the original value is not forwarded.
+
+    If the parsed data is mutated in place, mark_modified() must be called
+    so that to_data() serializes the data again.
+    """
 
     KIND_JSON = 'json'
     KIND_OTHER = 'other'
 
-    # b: bytes
+    JSON_LEADING_BYTES = b'{["-0123456789tfn'
+
+    # b: bytes or dict
     def __init__(self, b):
-        self.kind = self.KIND_OTHER
-        self.data = None
+        self.raw = None
+        self._kind = None
+        self._data = None
+        self._overrides = OrderedDict()
+        self._is_modified = False
+
+        if isinstance(b, dict):
+            self._kind = self.KIND_JSON
+            self._data = b
+            self._is_modified = True
+        elif isinstance(b, bytes) and b:
+            self.raw = b
+        else:
+            self._kind = self.KIND_OTHER
+            self._data = b
 
-        if not b:
-            self.data = b
+    @property
+    def kind(self):
+        if self._kind is None:
+            self._parse()
 
-        if isinstance(b, bytes):
-            try:
-                json_body = json.loads(b.decode('utf-8'))
-            except json.decoder.JSONDecodeError:
-                self.data = b
-                return
+        return self._kind
+
+    @property
+    def data(self):
+        if self._kind is None:
+            self._parse()
 
-            self.kind = self.KIND_JSON
-            self.data = json_body
-        elif isinstance(b, dict):
-            self.kind = self.KIND_JSON
-            self.data = b
+        return self._data
 
     @property
     def is_json(self):
@@ -243,13 +459,68 @@ class Body:
     def is_dict(self):
         return self.is_json and isinstance(self.data, dict)
 
+    def set(self, key, value):
+        """
+        Set a top-level key of a JSON object body.
+        """
+        if self.is_dict and key in self.data and key not in self._overrides:
+            self.data[key] = value
+            self.mark_modified()
+            return
+
+        self._overrides[key] = value
+        if self._data is not None:
+            self._data[key] = value
+
+    def mark_modified(self):
+        self._is_modified = True
+
     def to_data(self):
-        data = self.data
+        if self.raw is None or self._is_modified:
+            if self.is_json:
+                return json_codec.dumps_bytes(self.data)
 
-        if self.is_json:
-            return json.dumps(data).encode('utf-8')
+            return self.data
 
-        return data
+        if self._overrides:
+            return self._splice_overrides()
+
+        return self.raw
+
+    def _parse(self):
+        self._kind = self.KIND_OTHER
+        self._data = self.raw
+
+        # reject binary bodies without decoding them
+        if self.raw[:64].lstrip()[:1] not in self.JSON_LEADING_BYTES:
+            return
+
+        try:
+            json_body = json_codec.loads(self.raw)
+        except (UnicodeDecodeError, ValueError):
+            return
+
+        self._kind = self.KIND_JSON
+        self._data = json_body
+        if isinstance(json_body, dict):
+            json_body.update(self._overrides)
+
+    def _splice_overrides(self):
+        raw = self.raw
+        # strip the closing brace and the whitespaces around it
+        end = len(raw)
+        while raw[end - 1:end].isspace():
+            end = end - 1
+        end = end - 1
+        while raw[end - 1:end].isspace():
+            end = end - 1
+
+        members = b','.join([
+            json_codec.dumps_bytes(k) + b':' + json_codec.dumps_bytes(v)
+            for k, v in self._overrides.items()
+        ])
+        separator = b'' if raw[end - 1:end] == b'{' else b','
+        return b''.join([memoryview(raw)[:end], separator, members, b'}'])
 
 
 class AuthData:
@@ -260,6 +531,36 @@ class AuthData:
 
     @classmethod
     def from_cms_token(cls, cms_token):
+        """
+        Verify the cms token and return its AuthData.
+
+        Verified tokens are cached by their digest, a cached token is
+        checked against its expire_at on every hit.
+        """
+        now = datetime.utcnow().timestamp()
+        key = hashlib.sha256(str(cms_token).encode('utf-8')).digest()
+        authdata = verified_token_cache.get(key)
+        if authdata is not None:
+            if authdata.expire_at < now:
+                verified_token_cache.delete(key)
+                return None
+
+            return authdata
+
+        authdata = cls.decode_cms_token(cms_token)
+        if authdata is not None:
+            verified_token_cache.set(
+                key,
+                authdata,
+                ttl=min(CMS_AUTH_TOKEN_CACHE_TTL, authdata.expire_at - now))
+
+        return authdata
+
+    @classmethod
+    def decode_cms_token(cls, cms_token):
+        """
+        Verify the cms token without going through the cache.
+        """
         try:
             authdict = jwt.decode(
                 cms_token,
@@ -292,12 +593,83 @@ class AuthData:
 
 
 # req: SkygearRequest
-def request_skygear(req):
+def request_skygear(req, stream=False):
+    """
+    Send the request to skygear server.
+
+    If stream is True, the response body is not read into memory. It is
+    passed through chunk by chunk when the response is written out, so
+    the response body cannot be inspected or modified.
+    """
     requests_req = req.to_requests()
-    requests_resp = requests.Session().send(requests_req.prepare())
+    transport = UpstreamTransport.get_instance()
+    try:
+        with metrics.time_upstream_request(req.action):
+            if stream:
+                upstream_stream = transport.open_stream(
+                    requests_req.prepare(), action=req.action)
+                return SkygearResponse.from_upstream_stream(upstream_stream)
+
+            requests_resp = transport.send(
+                requests_req.prepare(), action=req.action)
+    except (requests.exceptions.Timeout, DeadlineExceeded):
+        return SkygearResponse.upstream_timeout()
+    except (requests.exceptions.ConnectionError, CircuitOpenError):
+        return SkygearResponse.upstream_unavailable()
+
     return SkygearResponse.from_requests(requests_resp)
 
 
+# req: SkygearRequest
+def request_skygear_coalesced(req):
+    """
+    Send the request to skygear server, sharing the upstream call with
+    concurrent identical requests of the same identity.
+
+    Each caller receives its own copy of the response.
+    """
+    with metrics.measure_upstream():
+        resp = upstream_flight.do(
+            request_key(req), lambda: request_skygear(req))
+    return resp.copy()
+
+
+# req: SkygearRequest
+def is_coalescable(req):
+    return CMS_PROXY_COALESCING and req.action in CMS_PROXY_COALESCE_ACTIONS
+
+
+# req: SkygearRequest
+def request_key(req):
+    """
+    A digest identifying the request and the identity making it.
+    """
+    data = req.body.data
+    query = {k: v for k, v in data.items() if k not in IDENTITY_KEYS}
+    key = {
+        'identity': request_identity(req),
+        'query': query,
+    }
+    key_bytes = json_codec.dumps_bytes(key, sort_keys=True)
+    return hashlib.sha256(key_bytes).hexdigest()
+
+
+# req: SkygearRequest
+def request_identity(req):
+    """
+    The identity that the response is generated for.
+
+    Requests with master key share the same identity. Otherwise, the
+    identity is the combination of the api key and the access token.
+    """
+    if req.is_master:
+        return 'master'
+
+    data = req.body.data
+    api_key = data.get('api_key') or req.headers.get('X-Skygear-Api-Key')
+    return '{}:{}'.format(api_key or '', req.access_token or '')
+
+
 def request_skygear_api(action, data={}, is_master=True):
     body_dict = {
         'action': action,
@@ -307,7 +679,21 @@ def request_skygear_api(action, data={}, is_master=True):
     body = Body(body_dict)
     req = SkygearRequest('POST', {}, body)
     req.is_master = is_master
-    return request_skygear(req)
+    if is_coalescable(req):
+        resp = request_skygear_coalesced(req)
+    else:
+        resp = request_skygear(req)
+
+    # imported here, proxy_cache imports request_key from this module
+    from .proxy_cache import ProxyResponseCache
+    ProxyResponseCache.get_instance().invalidate_for(req)
+
+    if resp.error_code:
+        raise SkygearException(
+            SkygearResponse.error_message(resp.error_code),
+            code=resp.error_code)
+
+    return resp
 
 
 def get_schema():
@@ -326,22 +712,134 @@ def save_records(records, database_id='_public', atomic=False):
     return resp.body.data['result']
 
 
-def fetch_records(record_type, predicate=None, includes=[]):
-    resp = request_skygear_api(
-        'record:query',
-        data={
-            'record_type': record_type,
-            'database_id': '_union',
-            'include': {i: {
-                '$type': 'keypath',
-                '$val': i
-            }
-                        for i in includes},
-            'predicate': predicate,
-        })
+def fetch_records(record_type,
+                  predicate=None,
+                  includes=[],
+                  sort=None,
+                  limit=None):
+    data = {
+        'record_type': record_type,
+        'database_id': '_union',
+        'include': {i: {
+            '$type': 'keypath',
+            '$val': i
+        }
+                    for i in includes},
+        'predicate': predicate,
+    }
+    if sort is not None:
+        data['sort'] = sort
+    if limit is not None:
+        data['limit'] = limit
+
+    resp = request_skygear_api('record:query', data=data)
     return resp.body.data['result']
 
 
+def fetch_record_pages(record_type,
+                       predicate=None,
+                       includes=[],
+                       page_size=CMS_RECORD_PAGE_SIZE,
+                       prefetch=False):
+    """
+    Fetch the records matching the predicate page by page, in the order of
+    creation. Pages are fetched as they are iterated.
+
+    Each page continues after the last record of the previous page, by
+    _created_at and _id, so that records saved in the meantime do not shift
+    the pages.
+
+    If prefetch is True, the next page is fetched in the background while
+    the current page is consumed.
+    """
+
+    def fetch_page(page_predicate):
+        return fetch_records(
+            record_type,
+            predicate=page_predicate,
+            includes=includes,
+            sort=CREATION_ORDER,
+            limit=page_size)
+
+    def next_page_predicate(records):
+        keyset = after_record_predicate(records[-1])
+        if predicate is None:
+            return keyset
+
+        return and_predicate([predicate, keyset])
+
+    future = None
+    try:
+        records = fetch_page(predicate)
+        while records:
+            has_next = len(records) >= page_size
+            if has_next and prefetch:
+                future = page_executor.submit(fetch_with_deadline,
+                                              deadline.current(), fetch_page,
+                                              next_page_predicate(records))
+
+            yield records
+
+            if not has_next:
+                return
+
+            if future is not None:
+                records = future.result()
+                future = None
+            else:
+                records = fetch_page(next_page_predicate(records))
+    finally:
+        if future is not None:
+            future.cancel()
+
+
+def fetch_with_deadline(at, fetch, *args):
+    with deadline.deadline_at(at):
+        return fetch(*args)
+
+
+def iter_records(record_type,
+                 predicate=None,
+                 includes=[],
+                 page_size=CMS_RECORD_PAGE_SIZE,
+                 prefetch=False):
+    """
+    Same as fetch_record_pages, yielding the records one by one.
+    """
+    pages = fetch_record_pages(
+        record_type,
+        predicate=predicate,
+        includes=includes,
+        page_size=page_size,
+        prefetch=prefetch)
+    for records in pages:
+        yield from records
+
+
+def after_record_predicate(record):
+    """
+    Match the records after the record, in the order of CREATION_ORDER.
+    """
+    created_at = {
+        '$type': 'date',
+        '$date': record['_created_at'],
+    }
+    record_id = record['_id'].split('/', 1)[1]
+    return or_predicate([
+        ['gt', {
+            '$type': 'keypath',
+            '$val': '_created_at'
+        }, created_at],
+        and_predicate([
+            eq_predicate('_created_at', created_at),
+            ['gt', {
+                '$type': 'keypath',
+                '$val': '_id'
+            }, record_id],
+        ]),
+    ])
+
+
 def or_predicate(predicates):
     p = ['or']
     for predicate in predicates:
@@ -350,6 +848,14 @@ def or_predicate(predicates):
     return p
 
 
+def and_predicate(predicates):
+    p = ['and']
+    for predicate in predicates:
+        p.append(predicate)
+
+    return p
+
+
 def eq_predicate(key, value):
     return ['eq', {'$type': 'keypath', '$val': key}, value]
 
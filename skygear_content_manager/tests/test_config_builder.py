@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from ..config_builder import build_config
+from ..config_loader import CONFIG_PARSER_FAST
+from ..config_loader import CONFIG_PARSER_SCHEMA
+from ..config_loader import ConfigLoader
+from ..schema.skygear_schema import SkygearSchemaSchema
+
+EXAMPLE_DIR = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'client', 'example')
+
+
+def field(name, type):
+    return {'name': name, 'type': type}
+
+
+EXAMPLES = [
+    ('cms-config.yaml', {
+        'record_types': {
+            'product': {
+                'fields': [
+                    field('name', 'string'),
+                    field('description', 'string'),
+                    field('picture', 'asset'),
+                    field('active', 'boolean'),
+                ],
+            },
+        },
+    }),
+    ('dev-config.yaml', {
+        'record_types': {
+            'field_demo': {
+                'fields': [
+                    field('name', 'string'),
+                    field('textarea', 'string'),
+                    field('dropdown', 'string'),
+                    field('wysiwyg', 'string'),
+                    field('datetime', 'datetime'),
+                    field('boolean', 'boolean'),
+                    field('integer', 'integer'),
+                    field('number', 'number'),
+                    field('reference', 'ref(ref_demo)'),
+                    field('imageasset', 'asset'),
+                ],
+            },
+            'ref_demo': {
+                'fields': [field('name', 'string')],
+            },
+            'back_ref_demo': {
+                'fields': [
+                    field('name', 'string'),
+                    field('reference', 'ref(field_demo)'),
+                ],
+            },
+        },
+    }),
+]
+
+
+def to_data(value):
+    """
+    Turn parsed config objects into comparable data.
+    """
+    if isinstance(value, dict):
+        return {k: to_data(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [to_data(v) for v in value]
+
+    if hasattr(value, '__dict__'):
+        return (type(value).__name__, to_data(vars(value)))
+
+    return value
+
+
+@pytest.mark.parametrize('filename,raw_schema', EXAMPLES)
+def test_fast_parser_builds_the_config_of_the_schemas(filename, raw_schema):
+    schema = SkygearSchemaSchema().load(raw_schema)
+    with open(os.path.join(EXAMPLE_DIR, filename), 'rb') as f:
+        content = f.read()
+
+    schema_loader = ConfigLoader(
+        snapshot_path=None, parser=CONFIG_PARSER_SCHEMA)
+    fast_loader = ConfigLoader(snapshot_path=None, parser=CONFIG_PARSER_FAST)
+    expected = schema_loader.parse_config_file(schema, content)
+
+    # build_config raises instead of falling back to the schemas
+    config = build_config(schema, fast_loader._load_config_data(content))
+    assert to_data(config) == to_data(expected)
+    assert to_data(fast_loader.parse_config_file(schema, content)) == \
+        to_data(expected)
@@ -0,0 +1,37 @@
+from unittest import mock
+
+import pytest
+
+from .. import json_codec
+
+CODECS = [json_codec.CODEC_STDLIB]
+if json_codec.orjson is not None:
+    CODECS.append(json_codec.CODEC_ORJSON)
+
+
+@pytest.fixture(params=CODECS)
+def codec(request):
+    with mock.patch.object(json_codec, 'codec_name', request.param):
+        yield request.param
+
+
+@pytest.mark.parametrize('obj, expected', [
+    ({
+        'name': 'café ☃'
+    }, '{"name":"café ☃"}'.encode('utf-8')),
+    ({
+        'a': float('nan'),
+        'b': [float('inf'), -float('inf'), 1.5]
+    }, b'{"a":null,"b":[null,null,1.5]}'),
+    ({
+        1: 'one',
+        'x': (1, 2)
+    }, b'{"1":"one","x":[1,2]}'),
+])
+def test_dumps_bytes_does_not_depend_on_codec(codec, obj, expected):
+    assert json_codec.dumps_bytes(obj) == expected
+
+
+def test_dumps_bytes_rejects_unknown_types(codec):
+    with pytest.raises(TypeError):
+        json_codec.dumps_bytes({'a': {1, 2}})
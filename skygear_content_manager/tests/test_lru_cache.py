@@ -0,0 +1,10 @@
+from ..lru_cache import LRUCache
+
+
+def test_set_oversized_value_removes_previous_value():
+    cache = LRUCache(ttl=60, max_size=10)
+    cache.set('key', 'small', size=5)
+    cache.set('key', 'large', size=11)
+
+    assert cache.get('key') is None
+    assert cache.stats()['size'] == 0
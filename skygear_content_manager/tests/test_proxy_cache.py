@@ -0,0 +1,89 @@
+from unittest import mock
+
+import pytest
+
+from .. import proxy_cache
+from .. import proxy_request
+from .. import skygear_utils
+from ..proxy_cache import ProxyResponseCache
+from ..skygear_utils import Body
+from ..skygear_utils import SkygearRequest
+from ..skygear_utils import SkygearResponse
+
+
+def make_request(data):
+    return SkygearRequest('POST', {}, Body(data))
+
+
+@pytest.fixture
+def cache():
+    cache = ProxyResponseCache(enabled=True)
+    with mock.patch.object(proxy_cache, 'proxy_response_cache', cache):
+        yield cache
+
+
+def cache_query(cache, record_type):
+    req = make_request({'action': 'record:query', 'record_type': record_type})
+    resp = SkygearResponse(200, {}, {}, Body({'result': []}))
+    cache.set(req, resp)
+    return req
+
+
+@pytest.mark.parametrize('data', [
+    {
+        'record_type': 1
+    },
+    {
+        'records': [{
+            '_recordType': 1
+        }]
+    },
+    {
+        'records': [{
+            '_recordType': ['note']
+        }]
+    },
+])
+def test_written_record_types_rejects_non_string_types(data):
+    assert proxy_cache.written_record_types(data) is None
+
+
+def test_invalidate_for_flushes_on_non_string_record_type(cache):
+    req = cache_query(cache, 'note')
+    cache.invalidate_for(
+        make_request({
+            'action': 'record:save',
+            'records': [{
+                '_recordType': 1
+            }]
+        }))
+
+    assert cache.get(req) is None
+
+
+def test_proxy_request_closes_stream_on_invalidation_failure(cache):
+    stream = mock.Mock()
+    resp = SkygearResponse(200, {}, {}, None, stream=stream)
+    req = make_request({'action': 'record:delete', 'ids': ['note/1']})
+    with mock.patch.dict(proxy_request.__globals__,
+                         {'request_skygear': mock.Mock(return_value=resp)}), \
+            mock.patch.object(cache, 'invalidate_for',
+                              side_effect=RuntimeError()):
+        with pytest.raises(RuntimeError):
+            proxy_request(req, stream=True)
+
+    assert stream.close.called
+
+
+def test_save_records_invalidates_record_queries(cache):
+    req = cache_query(cache, 'note')
+    other_req = cache_query(cache, 'user')
+    resp = SkygearResponse(200, {}, {}, Body({'result': []}))
+    with mock.patch.object(skygear_utils, 'request_skygear',
+                           return_value=resp), \
+            mock.patch.object(skygear_utils.options, 'masterkey',
+                              'master-key', create=True):
+        skygear_utils.save_records([{'_id': 'note/1'}])
+
+    assert cache.get(req) is None
+    assert cache.get(other_req) is not None
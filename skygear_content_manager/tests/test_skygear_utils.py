@@ -0,0 +1,97 @@
+from unittest import mock
+
+import pytest
+import requests
+from skygear.error import PluginUnavailable
+from skygear.error import SkygearException
+
+from .. import json_codec
+from .. import skygear_utils
+from ..proxy_cache import ProxyResponseCache
+
+
+@pytest.fixture
+def failing_upstream():
+    transport = mock.Mock()
+    transport.send.side_effect = requests.exceptions.ConnectionError()
+    with mock.patch.object(skygear_utils.UpstreamTransport, 'get_instance',
+                           return_value=transport), \
+            mock.patch.multiple(skygear_utils.options,
+                                masterkey='master-key',
+                                skygear_endpoint='http://skygear.test/',
+                                create=True):
+        yield transport
+
+
+@pytest.mark.parametrize('coalescing', [True, False])
+def test_request_skygear_api_raises_on_upstream_failure(
+        failing_upstream, coalescing):
+    with mock.patch.object(skygear_utils, 'CMS_PROXY_COALESCING', coalescing):
+        assert skygear_utils.is_coalescable(
+            skygear_utils.SkygearRequest(
+                'POST', {}, skygear_utils.Body({
+                    'action': 'record:query'
+                }))) == coalescing
+
+        with pytest.raises(SkygearException) as excinfo:
+            skygear_utils.fetch_records('note')
+
+    assert excinfo.value.code == PluginUnavailable
+    assert failing_upstream.send.called
+
+
+def test_get_schema_raises_on_coalesced_upstream_failure(failing_upstream):
+    with mock.patch.object(skygear_utils, 'CMS_PROXY_COALESCING', True):
+        with pytest.raises(SkygearException) as excinfo:
+            skygear_utils.get_schema()
+
+    assert excinfo.value.code == PluginUnavailable
+
+
+def test_proxied_body_does_not_forward_cms_token():
+    body = skygear_utils.Body(
+        b'{"action": "record:query", "access_token": "cms-token"}')
+    req = skygear_utils.SkygearRequest('POST', {}, body)
+    req.access_token = 'skygear-token'
+    req.is_master = True
+
+    with mock.patch.multiple(
+            skygear_utils.options,
+            masterkey='master-key',
+            skygear_endpoint='http://skygear.test/',
+            create=True):
+        data = req.to_requests().data
+
+    assert b'cms-token' not in data
+    assert json_codec.loads(data) == {
+        'action': 'record:query',
+        'access_token': 'skygear-token',
+        'api_key': 'master-key',
+    }
+
+
+def test_body_appends_absent_keys_to_original_bytes():
+    body = skygear_utils.Body(b'{"action": "record:query"}')
+    body.set('api_key', 'master-key')
+
+    assert body.to_data() == \
+        b'{"action": "record:query","api_key":"master-key"}'
+
+
+@pytest.mark.parametrize('action', [['record:query'], {}, 1, None])
+def test_request_action_ignores_non_string_actions(action):
+    req = skygear_utils.SkygearRequest(
+        'POST', {},
+        skygear_utils.Body(json_codec.dumps_bytes({
+            'action': action
+        })))
+
+    assert req.action is None
+    with mock.patch.object(skygear_utils, 'CMS_PROXY_COALESCING', True):
+        assert not skygear_utils.is_coalescable(req)
+
+    assert not ProxyResponseCache(enabled=True).is_cacheable(req)
+
+    transport = skygear_utils.UpstreamTransport()
+    assert not transport.is_idempotent(req.action)
+    assert transport.timeout_for(req.action)
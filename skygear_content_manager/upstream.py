@@ -0,0 +1,343 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from . import deadline
+from .circuit_breaker import CircuitBreaker
+from .circuit_breaker import CircuitOpenError
+from .settings import CMS_PROXY_STREAM_CHUNK_SIZE
+from .settings import CMS_UPSTREAM_ACTION_TIMEOUTS
+from .settings import CMS_UPSTREAM_BREAKER_ENABLED
+from .settings import CMS_UPSTREAM_BREAKER_FAILURE_RATE
+from .settings import CMS_UPSTREAM_BREAKER_MIN_CALLS
+from .settings import CMS_UPSTREAM_BREAKER_OPEN_DURATION
+from .settings import CMS_UPSTREAM_BREAKER_WINDOW
+from .settings import CMS_UPSTREAM_CONNECT_TIMEOUT
+from .settings import CMS_UPSTREAM_IDEMPOTENT_ACTIONS
+from .settings import CMS_UPSTREAM_MAX_RETRIES
+from .settings import CMS_UPSTREAM_POOL_SIZE
+from .settings import CMS_UPSTREAM_READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+upstream_transport = None
+upstream_transport_lock = threading.Lock()
+
+# responses telling that skygear server is not able to handle requests
+UNAVAILABLE_STATUS_CODES = (502, 503, 504)
+
+
+def create_circuit_breaker():
+    if not CMS_UPSTREAM_BREAKER_ENABLED:
+        return None
+
+    return CircuitBreaker(
+        window=CMS_UPSTREAM_BREAKER_WINDOW,
+        min_calls=CMS_UPSTREAM_BREAKER_MIN_CALLS,
+        failure_rate=CMS_UPSTREAM_BREAKER_FAILURE_RATE,
+        open_duration=CMS_UPSTREAM_BREAKER_OPEN_DURATION,
+        name='skygear',
+    )
+
+
+class UpstreamTransport:
+    """
+    Process-wide transport for requests sent to skygear server.
+
+    Connections are kept alive in a bounded pool shared by all threads.
+    When every connection is in use, callers wait for one to be released
+    instead of opening a new connection.
+
+    Timeouts and waits are limited by the deadline of the current thread,
+    see the deadline module. Requests are rejected with CircuitOpenError
+    while the circuit breaker is open.
+    """
+
+    def __init__(self,
+                 pool_size=CMS_UPSTREAM_POOL_SIZE,
+                 connect_timeout=CMS_UPSTREAM_CONNECT_TIMEOUT,
+                 read_timeout=CMS_UPSTREAM_READ_TIMEOUT,
+                 max_retries=CMS_UPSTREAM_MAX_RETRIES,
+                 idempotent_actions=CMS_UPSTREAM_IDEMPOTENT_ACTIONS,
+                 action_timeouts=CMS_UPSTREAM_ACTION_TIMEOUTS,
+                 breaker=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.idempotent_actions = set(idempotent_actions)
+        self.action_timeouts = dict(action_timeouts)
+        if breaker is None:
+            breaker = create_circuit_breaker()
+        self.breaker = breaker
+
+        self.adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waits = 0
+        self._requests = 0
+        self._retries = 0
+
+    @classmethod
+    def get_instance(cls):
+        global upstream_transport
+        if upstream_transport is None:
+            with upstream_transport_lock:
+                if upstream_transport is None:
+                    upstream_transport = cls()
+
+        return upstream_transport
+
+    def is_idempotent(self, action):
+        return action in self.idempotent_actions
+
+    def timeout_for(self, action):
+        read_timeout = self.action_timeouts.get(action, self.read_timeout)
+        return (self.connect_timeout, read_timeout)
+
+    def send(self, prepared_request, action=None, timeout=None):
+        """
+        Send a prepared request with a pooled connection.
+
+        Failed attempts are retried only when it is safe to do so, i.e.
+        the connection could not be established, or the action is listed
+        in CMS_UPSTREAM_IDEMPOTENT_ACTIONS.
+        """
+        resp = self._send(prepared_request, action, timeout, stream=False)
+        self._release()
+        return resp
+
+    def open_stream(self,
+                    prepared_request,
+                    action=None,
+                    timeout=None,
+                    chunk_size=CMS_PROXY_STREAM_CHUNK_SIZE):
+        """
+        Send a prepared request without reading the response body.
+
+        The pooled connection is held until the returned UpstreamStream
+        is exhausted or closed.
+        """
+        resp = self._send(prepared_request, action, timeout, stream=True)
+        return UpstreamStream(resp, self._release, chunk_size)
+
+    def _send(self, prepared_request, action, timeout, stream):
+        """
+        Return the response with its connection slot still acquired.
+        """
+        if timeout is None:
+            timeout = self.timeout_for(action)
+
+        attempt = 0
+        while True:
+            attempt_timeout = deadline.clip_timeout(timeout)
+            self._acquire()
+            try:
+                call = self._before_call()
+            except CircuitOpenError:
+                self._release()
+                raise
+
+            try:
+                resp = self.session.send(
+                    prepared_request, timeout=attempt_timeout, stream=stream)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                self._after_call(call, failed=True)
+                self._release()
+                if attempt >= self.max_retries or \
+                   not self._should_retry(e, action):
+                    raise
+
+                attempt = attempt + 1
+                with self._lock:
+                    self._retries = self._retries + 1
+                logger.warning('Retrying skygear request "%s" (%d/%d): %s',
+                               action, attempt, self.max_retries, e)
+                continue
+            except Exception:
+                self._after_call(call)
+                self._release()
+                raise
+
+            self._after_call(
+                call, failed=resp.status_code in UNAVAILABLE_STATUS_CODES)
+            return resp
+
+    def preconnect(self, url):
+        """
+        Open the connections of the pool, with one HEAD request to url per
+        connection. The requests are sent concurrently, so that each of
+        them opens a connection of its own.
+        """
+        at = deadline.current()
+
+        def head():
+            with deadline.deadline_at(at):
+                self.send(requests.Request('HEAD', url).prepare())
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = [executor.submit(head) for i in range(self.pool_size)]
+            for future in futures:
+                future.result()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'waits': self._waits,
+                'requests': self._requests,
+                'retries': self._retries,
+            }
+
+        stats['idle'] = self._idle_connections()
+        if self.breaker is not None:
+            stats['breaker'] = self.breaker.stats()
+        return stats
+
+    def _should_retry(self, error, action):
+        if is_connect_error(error):
+            # the request was never sent
+            return True
+
+        return self.is_idempotent(action)
+
+    def _before_call(self):
+        if self.breaker is not None:
+            return self.breaker.before_call()
+
+        return None
+
+    def _after_call(self, call, failed=False):
+        if self.breaker is not None:
+            self.breaker.after_call(call, failed=failed)
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waits = self._waits + 1
+
+            left = deadline.remaining()
+            if left is None:
+                self._slots.acquire()
+            elif left <= 0 or not self._slots.acquire(timeout=left):
+                raise deadline.DeadlineExceeded()
+
+        with self._lock:
+            self._in_use = self._in_use + 1
+            self._requests = self._requests + 1
+
+    def _release(self):
+        with self._lock:
+            self._in_use = self._in_use - 1
+        self._slots.release()
+
+    def _idle_connections(self):
+        """
+        Count the open connections that are waiting in urllib3 pools.
+
+        This reads urllib3 internals and is meant for monitoring only.
+        """
+        count = 0
+        try:
+            pools = self.adapter.poolmanager.pools
+            with pools.lock:
+                connection_pools = list(pools._container.values())
+
+            for connection_pool in connection_pools:
+                queue = connection_pool.pool
+                if queue is None:
+                    continue
+                count = count + \
+                    len([c for c in list(queue.queue) if c is not None])
+        except Exception:
+            logger.debug('Unable to count idle connections', exc_info=True)
+
+        return count
+
+
+class UpstreamStream:
+    """
+    Iterate an upstream response body chunk by chunk.
+
+    The underlying connection is returned to the pool once the body is
+    exhausted or the stream is closed, whichever happens first. werkzeug
+    calls close() on response iterables, so an unconsumed stream does not
+    leak its connection.
+    """
+
+    def __init__(self, response, release, chunk_size):
+        self.response = response
+        self.chunk_size = chunk_size
+        # set to False to pass through the encoded body as is
+        self.decode_content = True
+        self._release = release
+        self._closed = False
+
+    @property
+    def is_encoded(self):
+        return 'Content-Encoding' in self.response.headers
+
+    @property
+    def is_gzip(self):
+        encoding = self.response.headers.get('Content-Encoding', '')
+        return encoding.strip().lower() == 'gzip'
+
+    @property
+    def content_length(self):
+        """
+        Length of the decoded body, None if not known in advance.
+        """
+        if self.is_encoded:
+            return None
+
+        try:
+            return int(self.response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
+    def __iter__(self):
+        try:
+            for chunk in self.response.raw.stream(
+                    self.chunk_size, decode_content=self.decode_content):
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        try:
+            self.response.close()
+        finally:
+            self._release()
+
+
+def is_connect_error(error):
+    """
+    Whether the request failed before it was sent, i.e. the connection
+    could not be established because it timed out or was refused.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+
+    # requests wraps the urllib3 MaxRetryError, which has the reason
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
@@ -3,10 +3,12 @@ from marshmallow import Schema
 from marshmallow import fields
 
 from ..db_session import scoped_session
+from ..deadline import deadline
 from ..models.user import Auth
 from ..models.user import User
 from ..record_utils import apply_filters
-from ..record_utils import fetch_records_by_values_in_key
+from ..record_utils import iter_records_by_values_in_key
+from ..settings import CMS_REQUEST_DEADLINE
 from ..skygear_utils import validate_master_user
 
 PAGE_SIZE = 25
@@ -44,7 +46,7 @@ def register_lambdas(settings):
         page_size = kwargs.get('perPage', PAGE_SIZE)
         page = kwargs.get('page', PAGE)
         filter = kwargs.get('filter', [])
-        with scoped_session() as session:
+        with scoped_session() as session, deadline(CMS_REQUEST_DEADLINE):
             query = session.query(Auth).join(Auth.user)
             query = apply_filters(query, filter, filter_name_to_col)
             total_count = query.count()
@@ -57,7 +59,7 @@ def register_lambdas(settings):
     @skygear.op('user:get')
     def get_user(user_id):
         validate_master_user()
-        with scoped_session() as session:
+        with scoped_session() as session, deadline(CMS_REQUEST_DEADLINE):
             result = session.query(Auth).filter(Auth.id == user_id).one()
             user = UserSchema().dump(result)
             inject_user_record([user])
@@ -66,7 +68,7 @@ def register_lambdas(settings):
 
 def inject_user_record(users):
     user_ids = [user['id'] for user in users]
-    user_records = fetch_records_by_values_in_key('user', '_id', user_ids)
+    user_records = iter_records_by_values_in_key('user', '_id', user_ids)
     user_record_map = {r['_id']: r for r in user_records}
 
     for user in users:
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from skygear.options import options
+from skygear.utils.db import _get_engine
+
+from . import deadline
+from .config_loader import ConfigLoader
+from .import_export.csv_deserializer import get_record_deserializer
+from .import_export.export_plan import compile_export_plans
+from .settings import CMS_WARM_UP_TIMEOUT
+from .skygear_async_utils import call_with_deadline
+from .upstream import UpstreamTransport
+
+logger = logging.getLogger(__name__)
+
+warm_up_status = {
+    'completed': False,
+    'seconds': None,
+    'errors': [],
+}
+warm_up_status_lock = threading.Lock()
+
+
+def warm_up(timeout=CMS_WARM_UP_TIMEOUT):
+    """
+    Load what the first requests would otherwise wait for, i.e. the schema,
+    the config and the compiled export plans and deserializers, and open
+    the connections of the upstream and database pools.
+
+    Failures are logged and left to the first requests.
+    """
+    start = time.perf_counter()
+    errors = []
+    with deadline.deadline(timeout), \
+            ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            ('config',
+             executor.submit(call_with_deadline, deadline.current(),
+                             warm_up_config)),
+            ('upstream',
+             executor.submit(call_with_deadline, deadline.current(),
+                             warm_up_upstream)),
+            ('database',
+             executor.submit(call_with_deadline, deadline.current(),
+                             warm_up_database)),
+        ]
+        for name, future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.exception('Failed to warm up %s', name)
+                errors.append(name)
+
+    seconds = time.perf_counter() - start
+    with warm_up_status_lock:
+        warm_up_status.update({
+            'completed': True,
+            'seconds': seconds,
+            'errors': errors,
+        })
+
+    logger.info('Warmed up in %.2fs', seconds)
+
+
+def get_warm_up_status():
+    with warm_up_status_lock:
+        return dict(warm_up_status)
+
+
+def warm_up_config():
+    """
+    Load the config, the schema is downloaded while the config file is
+    fetched. Both downloads are limited by the warm-up deadline.
+    """
+    config = ConfigLoader.get_instance().get_config()
+    compile_config(config)
+
+
+def compile_config(config):
+    """
+    Compile the plans of the exports, in case they failed to compile when
+    the config was loaded, and the deserializers of the imports.
+    """
+    compile_export_plans(config)
+
+    for name, import_config in config.imports.items():
+        try:
+            get_record_deserializer(import_config)
+        except Exception:
+            logger.warning(
+                'Failed to compile import "%s"', name, exc_info=True)
+
+
+def warm_up_upstream():
+    """
+    Open the connections of the upstream pool to skygear server.
+    """
+    UpstreamTransport.get_instance().preconnect(options.skygear_endpoint)
+
+
+def warm_up_database():
+    """
+    Open the connections of the database pool.
+    """
+    engine = _get_engine()
+    size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+    connections = []
+    try:
+        for i in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute('SELECT 1')
+    finally:
+        for connection in connections:
+            connection.close()
@@ -1,10 +1,24 @@
 import skygear
+from werkzeug.http import quote_etag
 from werkzeug.wrappers import ResponseStreamMixin
 
 
-def prepare_file_response(filename, mimetype):
+def prepare_file_response(filename, mimetype, response=None):
+    """
+    Prepare a file download response, written to response.stream, or sent
+    chunk by chunk if response is an iterable.
+    """
     headers = {'Content-disposition': 'attachment; filename=' + filename}
-    return StreamableResponse(mimetype=mimetype, headers=headers)
+    return StreamableResponse(
+        response=response, mimetype=mimetype, headers=headers)
+
+
+def set_etag(response, etag):
+    """
+    Set a strong ETag, skygear.Response does not have the ETag methods of
+    werkzeug.
+    """
+    response.headers['ETag'] = quote_etag(etag)
 
 
 class StreamableResponse(skygear.Response, ResponseStreamMixin):